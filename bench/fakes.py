@@ -0,0 +1,300 @@
+import asyncio
+from contextlib import asynccontextmanager
+from itertools import count
+from time import monotonic, perf_counter
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from discord.ext.commands import Context
+
+_ids = count(700_000_000_000_000_000)
+
+
+class FakeRole:
+    """A host guild role, with just what the bot reads."""
+
+    def __init__(self, name: str) -> None:
+        self.id = next(_ids)
+        self.name = name
+        self.members: List["FakeMember"] = []
+
+
+class FakeMember:
+    """A guild member (or user, in DMs), with just what the cogs read."""
+
+    def __init__(
+        self, guild: "FakeGuild", name: str, display_name: str, roles: Iterable[FakeRole] = ()
+    ) -> None:
+        self.id = next(_ids)
+        self.guild = guild
+        self.name = name
+        self.display_name = display_name
+        self.roles = list(roles)
+        self.bot = False
+
+        for role in self.roles:
+            role.members.append(self)
+
+    @property
+    def mention(self) -> str:
+        """The member's mention string."""
+        return f"<@{self.id}>"
+
+    async def add_roles(self, *roles: FakeRole) -> None:
+        """Add roles locally."""
+        self.roles.extend(roles)
+
+    async def remove_roles(self, *roles: FakeRole) -> None:
+        """Remove roles locally."""
+        self.roles = [role for role in self.roles if role not in roles]
+
+
+class FakeGuild:
+    """The host guild, with hackers & mods."""
+
+    def __init__(self, guild_id: int, hacker_role_name: str, mod_role_name: str) -> None:
+        self.id = guild_id
+        self.hacker_role = FakeRole(hacker_role_name)
+        self.mod_role = FakeRole(mod_role_name)
+        self.roles = [self.hacker_role, self.mod_role]
+        self.members: Dict[int, FakeMember] = {}
+
+    def add_member(self, name: str, display_name: str, roles: Iterable[FakeRole]) -> FakeMember:
+        """Add a member to the guild."""
+        member = FakeMember(self, name, display_name, roles)
+        self.members[member.id] = member
+
+        return member
+
+    def get_member(self, user_id: int) -> Optional[FakeMember]:
+        """Get a member by ID."""
+        return self.members.get(user_id)
+
+    def get_role(self, role_id: int) -> Optional[FakeRole]:
+        """Get a role by ID."""
+        return next((role for role in self.roles if role.id == role_id), None)
+
+
+class FakeChannel:
+    """A text or DM channel."""
+
+    def __init__(self) -> None:
+        self.id = next(_ids)
+
+
+class FakeMessage:
+    """A command message, sent in the host guild or (with no guild) in DMs."""
+
+    def __init__(self, content: str, author: FakeMember, guild: Optional[FakeGuild]) -> None:
+        self.id = next(_ids)
+        self.content = content
+        self.author = author
+        self.guild = guild
+        self.channel = FakeChannel()
+        self.mentions: List[FakeMember] = []
+        self._state = None
+
+    async def delete(self) -> None:
+        """Messages are never really sent, so there is nothing to delete."""
+
+
+class LoadContext(Context):
+    """A command context whose replies are counted instead of sent to Discord."""
+
+    def __init__(self, **attrs: Any) -> None:
+        super().__init__(**attrs)
+        self.replies = 0
+        self.reply_bytes = 0
+
+    async def send(self, content: Optional[str] = None, **kwargs: Any) -> None:
+        """Count a reply, and the size of its attachment."""
+        self.replies += 1
+
+        if kwargs.get("file"):
+            self.reply_bytes += len(kwargs["file"].fp.getbuffer())
+
+
+class TimedPool:
+    """Wraps a pool to record how long every `acquire` waited for a connection."""
+
+    def __init__(self, pool: Any) -> None:
+        self._pool = pool
+        self.waits: List[float] = []
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pool, name)
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator[Any]:
+        """Acquire a connection from the wrapped pool."""
+        started = perf_counter()
+
+        async with self._pool.acquire() as conn:
+            self.waits.append(perf_counter() - started)
+            yield conn
+
+
+class Row(dict):
+    """A row of a `MemoryPool` result, which unpacks into its values like an asyncpg Record."""
+
+    def __iter__(self) -> Iterator[Any]:
+        return iter(self.values())
+
+
+class MemoryPool:
+    """
+    An asyncpg-compatible pool that keeps the bot's tables in memory.
+
+    It answers the bot's own queries only, recognised by their text, and sleeps for `latency` seconds
+    per round trip to stand in for the network & the database.
+    """
+
+    def __init__(self, size: int = 10, latency: float = 0.0005) -> None:
+        self.latency = latency
+        self.users: Dict[int, int] = {}
+        self.codes: Dict[str, Tuple[str, int]] = {}
+        self.redemptions: Dict[int, Dict[str, float]] = {}
+        self._semaphore = asyncio.Semaphore(size)
+
+        # (query fragment, handler) pairs, most specific first
+        self.handlers: List[Tuple[str, Callable[..., List[Row]]]] = [
+            ("INSERT INTO Redemptions", self._redeem),
+            ("FROM Redemptions JOIN Codes", self._recent_titles),
+            ("WHERE user_id = ANY", self._give),
+            ("SELECT user_id, points FROM Users", self._leaderboard),
+            ("INSERT INTO Users", self._insert_user),
+            ("DELETE FROM Users WHERE", self._delete_user),
+            ("DELETE FROM Users", self._delete_users),
+            ("SELECT code, title, points FROM Codes", self._codes),
+            ("INSERT INTO Codes", self._upsert_code),
+            ("DELETE FROM Codes", self._delete_codes),
+        ]
+
+    @asynccontextmanager
+    async def acquire(self) -> AsyncIterator["MemoryConnection"]:
+        """Acquire a connection, waiting if all of them are in use."""
+        async with self._semaphore:
+            yield MemoryConnection(self)
+
+    async def close(self) -> None:
+        """Nothing to close."""
+
+    def run(self, query: str, args: Tuple[Any, ...]) -> List[Row]:
+        """Answer a query."""
+        query = " ".join(query.split())
+
+        for fragment, handler in self.handlers:
+            if fragment in query:
+                return handler(*args)
+
+        raise NotImplementedError(f"MemoryPool can't answer: {query}")
+
+    def _redeem(self, user_id: int, code: str, points: int) -> List[Row]:
+        registered = user_id in self.users
+        redeemed = self.redemptions.setdefault(user_id, {})
+        credited = None
+
+        if registered and code not in redeemed:
+            redeemed[code] = monotonic()
+            credited = self.users[user_id] = self.users[user_id] + points
+
+        return [Row({"registered": registered, "points": credited})]
+
+    def _recent_titles(self, user_id: int, limit: int) -> List[Row]:
+        redeemed = self.redemptions.get(user_id, {})
+        recent = sorted(redeemed, key=redeemed.get, reverse=True)[:limit]
+
+        return [Row(title=self.codes[code][0]) for code in recent if code in self.codes]
+
+    def _give(self, user_ids: List[int], points: int) -> List[Row]:
+        updated = []
+
+        for user_id in user_ids:
+            if user_id in self.users:
+                self.users[user_id] += points
+                updated.append(Row(user_id=user_id, points=self.users[user_id]))
+
+        return updated
+
+    def _leaderboard(self) -> List[Row]:
+        users = sorted(self.users.items(), key=lambda user: (user[1], user[0]), reverse=True)
+
+        return [Row(user_id=user_id, points=points) for user_id, points in users]
+
+    def _insert_user(self, user_id: int) -> List[Row]:
+        if user_id in self.users:
+            return []
+
+        self.users[user_id] = 0
+        return [Row(user_id=user_id)]
+
+    def _delete_user(self, user_id: int) -> List[Row]:
+        self.users.pop(user_id, None)
+        self.redemptions.pop(user_id, None)
+        return []
+
+    def _delete_users(self) -> List[Row]:
+        self.users.clear()
+        self.redemptions.clear()
+        return []
+
+    def _codes(self) -> List[Row]:
+        return [Row(code=code, title=title, points=points) for code, (title, points) in self.codes.items()]
+
+    def _upsert_code(self, code: str, title: str, points: int) -> List[Row]:
+        self.codes[code] = title, points
+        return []
+
+    def _delete_codes(self, codes: List[str]) -> List[Row]:
+        for code in codes:
+            self.codes.pop(code, None)
+
+        return []
+
+
+class MemoryConnection:
+    """A connection of a `MemoryPool`."""
+
+    def __init__(self, pool: MemoryPool) -> None:
+        self._pool = pool
+
+    async def _round_trip(self, query: str, args: Tuple[Any, ...]) -> List[Row]:
+        await asyncio.sleep(self._pool.latency)
+        return self._pool.run(query, args)
+
+    async def fetch(self, query: str, *args: Any) -> List[Row]:
+        """Run a query and get all of its rows."""
+        return await self._round_trip(query, args)
+
+    async def fetchrow(self, query: str, *args: Any) -> Optional[Row]:
+        """Run a query and get its first row."""
+        rows = await self._round_trip(query, args)
+        return rows[0] if rows else None
+
+    async def fetchval(self, query: str, *args: Any) -> Any:
+        """Run a query and get the first value of its first row."""
+        row = await self.fetchrow(query, *args)
+        return next(iter(row)) if row else None
+
+    async def execute(self, query: str, *args: Any) -> str:
+        """Run a query."""
+        await self._round_trip(query, args)
+        return "OK"
+
+    async def executemany(self, query: str, args: Iterable[Tuple[Any, ...]]) -> None:
+        """Run a query for every set of arguments, in one round trip."""
+        await asyncio.sleep(self._pool.latency)
+
+        for item in args:
+            self._pool.run(query, tuple(item))
+
+    async def copy_records_to_table(
+        self, table: str, *, records: Iterable[Tuple[int, int]], columns: Optional[Tuple[str, ...]] = None
+    ) -> None:
+        """Bulk load (user_id, points) records into Users."""
+        await asyncio.sleep(self._pool.latency)
+        self._pool.users.update((user_id, points) for user_id, points in records)
+
+    @asynccontextmanager
+    async def transaction(self) -> AsyncIterator[None]:
+        """Queries are already atomic, as they never yield to the event loop midway."""
+        yield
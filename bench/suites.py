@@ -0,0 +1,198 @@
+from functools import partial
+from random import Random
+from typing import Dict, List, Optional
+
+from bench.timing import Result, measure, measure_async
+
+# Display names of increasing length, with a mix of scripts and emoji
+NAMES = {
+    "ascii-short": "Ada",
+    "ascii-long": "The Extremely Long Display Name Of A Hacker Who Likes Typing",
+    "accents": "Zoë Łukasiewicz-Ångström Müller",
+    "cjk": "ハッカソンの参加者ハッカソンの参加者",
+    "emoji": "🎄 Holiday Hacker 🎅🎁❄️ Extraordinaire 🦌",
+}
+
+
+def synthetic_members(count: int, seed: int = 0) -> List["RankedMember"]:  # noqa: F821
+    """Generate a leaderboard page of synthetic members."""
+    from bot.extensions.activity import RankedMember
+
+    rng = Random(seed)
+    names = list(NAMES.values())
+
+    return [
+        RankedMember(
+            rank=rank,
+            username=f"hacker{rank}",
+            display_name=rng.choice(names),
+            score=rng.randint(0, 500),
+        )
+        for rank in range(1, count + 1)
+    ]
+
+
+def bench_renderers(iterations: int) -> List[Result]:
+    """Benchmark the leaderboard and profile card renderers."""
+    from bot.extensions.activity import render_leaderboard_image
+    from bot.extensions.profile import load_snow_bank, render_profile_image
+
+    load_snow_bank()
+
+    members = synthetic_members(10)
+    member = {"name": "hacker1", "display_name": NAMES["accents"]}
+    user = {"points": 120, "rank": 3}
+    codes = ["Talk: Intro to Python", "Challenge: The CLI Challenge"]
+
+    results = [
+        measure("render_leaderboard_image", lambda: render_leaderboard_image(None, 1, members), iterations)
+    ]
+
+    for animated in (False, True):
+        for center in (True, False):
+            flags = [flag for flag, on in (("static", not animated), ("left", not center)) if on]
+            variant = f"{'animated' if animated else 'static'},{'center' if center else 'left'}"
+            render = partial(render_profile_image, None, member, user, codes, flags)
+            results.append(measure(f"render_profile_image[{variant}]", render, iterations))
+
+    return results
+
+
+def bench_text(iterations: int) -> List[Result]:
+    """Benchmark get_max_str over name lengths and Unicode mixes, cold and memoized."""
+    from bot.assets import NUNITO_EXTRABOLD, get_font
+    from bot.text import get_max_str
+
+    extrabold = get_font(NUNITO_EXTRABOLD, 24)
+    results = []
+
+    for label, name in NAMES.items():
+
+        def cold(name: str = name) -> None:
+            get_max_str.cache_clear()
+            get_max_str(extrabold, name, 300)
+
+        warm = partial(get_max_str, extrabold, name, 300)
+        results.append(measure(f"get_max_str[{label},cold]", cold, iterations))
+        results.append(measure(f"get_max_str[{label},warm]", warm, iterations))
+
+    return results
+
+
+def bench_leaderboard(sizes: List[int], iterations: int) -> List[Result]:
+    """Benchmark the in-memory leaderboard index."""
+    from bot.leaderboard import Leaderboard
+
+    results = []
+
+    for size in sizes:
+        rng = Random(size)
+        leaderboard = Leaderboard()
+        leaderboard.load((user_id, rng.randint(0, 500)) for user_id in range(size))
+
+        def update(leaderboard: Leaderboard = leaderboard, rng: Random = rng, size: int = size) -> None:
+            leaderboard.update(rng.randrange(size), rng.randint(0, 500))
+
+        get_rank = partial(leaderboard.get_rank, size // 2)
+        get_page = partial(leaderboard.get_page, size // 2)
+        results.append(measure(f"leaderboard.get_rank[{size}]", get_rank, iterations))
+        results.append(measure(f"leaderboard.get_page[{size}]", get_page, iterations))
+        results.append(measure(f"leaderboard.update[{size}]", update, iterations))
+
+    return results
+
+
+async def bench_sql(dsn: str, sizes: List[int], iterations: int) -> List[Result]:
+    """Benchmark the leaderboard & rank SQL against a local Postgres, in a throwaway schema."""
+    from asyncpg import connect
+
+    from bot.queries import STATEMENTS
+
+    conn = await connect(dsn)
+    results = []
+
+    try:
+        await conn.execute("DROP SCHEMA IF EXISTS holiday_bench CASCADE; CREATE SCHEMA holiday_bench")
+        await conn.execute("SET search_path TO holiday_bench")
+        await conn.execute(
+            """
+            CREATE TABLE Users(user_id BIGINT PRIMARY KEY, points INT);
+            CREATE INDEX users_leaderboard_idx ON Users (points DESC, user_id DESC);
+            """
+        )
+
+        for size in sizes:
+            rng = Random(size)
+
+            await conn.execute("TRUNCATE Users")
+            await conn.copy_records_to_table(
+                "users", records=[(user_id, rng.randint(0, 500)) for user_id in range(size)]
+            )
+            await conn.execute("ANALYZE Users")
+
+            user_id = size // 2
+            queries: Dict[str, tuple] = {
+                "leaderboard_load": (STATEMENTS["leaderboard"], ()),
+                "leaderboard_offset_page": (
+                    "SELECT * FROM Users ORDER BY points DESC, user_id DESC LIMIT 10 OFFSET $1",
+                    (size // 2,),
+                ),
+                "leaderboard_keyset_page": (
+                    """
+                    SELECT * FROM Users WHERE (points, user_id) < ($1, $2)
+                    ORDER BY points DESC, user_id DESC LIMIT 10
+                    """,
+                    (250, user_id),
+                ),
+                "rank_correlated_subquery": (
+                    """
+                    SELECT (
+                        SELECT COUNT(user_id) FROM Users AS inner_users
+                        WHERE (inner_users.points > Users.points)
+                           OR (inner_users.points = Users.points AND inner_users.user_id > Users.user_id)
+                    ) + 1
+                    FROM Users WHERE user_id = $1
+                    """,
+                    (user_id,),
+                ),
+            }
+
+            for name, (query, args) in queries.items():
+
+                async def run(query: str = query, args: tuple = args) -> None:
+                    await conn.fetch(query, *args)
+
+                results.append(await measure_async(f"sql.{name}[{size}]", run, iterations))
+
+            # The bot's own statements, prepared like the pool's connections do
+            for name, args in (("leaderboard", ()), ("give_points", ([user_id], 0))):
+                statement = await conn.prepare(STATEMENTS[name])
+                results.append(
+                    await measure_async(
+                        f"sql.prepared.{name}[{size}]", partial(statement.fetch, *args), iterations
+                    )
+                )
+    finally:
+        await conn.execute("DROP SCHEMA IF EXISTS holiday_bench CASCADE")
+        await conn.close()
+
+    return results
+
+
+def compare(results: List[Result], baseline: Optional[Dict[str, dict]]) -> List[str]:
+    """Format results as table rows, with the change in ops/sec against a baseline."""
+    rows = []
+
+    for result in results:
+        change = ""
+
+        if baseline and result.name in baseline:
+            ratio = result.ops_per_sec / baseline[result.name]["ops_per_sec"] - 1
+            change = f"{ratio:+.1%}"
+
+        rows.append(
+            f"{result.name:<52} {result.ops_per_sec:>10.1f} {result.p50_ms:>9.3f} "
+            f"{result.p99_ms:>9.3f} {result.peak_kib:>10.1f} {change:>8}"
+        )
+
+    return rows
@@ -0,0 +1,82 @@
+import tracemalloc
+from dataclasses import asdict, dataclass
+from statistics import quantiles
+from time import perf_counter
+from typing import Awaitable, Callable, Dict, List
+
+
+@dataclass
+class Result:
+    """A dataclass for the timings of one benchmark."""
+
+    name: str
+    iterations: int
+    ops_per_sec: float
+    p50_ms: float
+    p99_ms: float
+    peak_kib: float
+
+    def to_dict(self) -> Dict[str, float]:
+        """Convert the result to a JSON-friendly dict."""
+        return asdict(self)
+
+
+def summarize(name: str, samples: List[float], peak: int) -> Result:
+    """Summarize per-iteration timings (in seconds) and a peak memory size (in bytes)."""
+    percentiles = quantiles(samples, n=100, method="inclusive") if len(samples) > 1 else samples * 99
+
+    return Result(
+        name=name,
+        iterations=len(samples),
+        ops_per_sec=len(samples) / sum(samples),
+        p50_ms=percentiles[49] * 1000,
+        p99_ms=percentiles[98] * 1000,
+        peak_kib=peak / 1024,
+    )
+
+
+def measure(name: str, fn: Callable[[], object], iterations: int, warmup: int = 1) -> Result:
+    """
+    Time a function over a number of iterations.
+
+    Peak memory is the Python heap peak (tracemalloc), measured in a separate pass so that tracing
+    doesn't skew the timings. Memory allocated by C extensions such as PIL isn't included.
+    """
+    for _ in range(warmup):
+        fn()
+
+    samples = []
+
+    for _ in range(iterations):
+        started = perf_counter()
+        fn()
+        samples.append(perf_counter() - started)
+
+    tracemalloc.start()
+    fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return summarize(name, samples, peak)
+
+
+async def measure_async(
+    name: str, fn: Callable[[], Awaitable[object]], iterations: int, warmup: int = 1
+) -> Result:
+    """Time a coroutine function over a number of iterations, like `measure`."""
+    for _ in range(warmup):
+        await fn()
+
+    samples = []
+
+    for _ in range(iterations):
+        started = perf_counter()
+        await fn()
+        samples.append(perf_counter() - started)
+
+    tracemalloc.start()
+    await fn()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return summarize(name, samples, peak)
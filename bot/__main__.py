@@ -21,8 +21,9 @@ bot = HolidayBot(
     help_command=None,
 )
 
-for extension in bot.get_extensions():
-    bot.load_extension(extension)
-    logger.info(f'Loaded extension "{extension}"')
+with bot.startup.timing_extensions(bot.get_extensions()):
+    for extension in bot.get_extensions():
+        bot.load_extension(extension)
+        logger.info(f'Loaded extension "{extension}"')
 
 bot.run(environ.get("BOT_TOKEN"), bot=True, reconnect=True)
@@ -0,0 +1,33 @@
+from functools import lru_cache
+
+from PIL import Image, ImageFont
+
+NUNITO_REGULAR = "assets/fonts/Nunito/Nunito-Regular.ttf"
+NUNITO_BOLD = "assets/fonts/Nunito/Nunito-Bold.ttf"
+NUNITO_EXTRABOLD = "assets/fonts/Nunito/Nunito-ExtraBold.ttf"
+
+PROFILE_BACKGROUND = "assets/img/profile_card_bg.png"
+
+
+@lru_cache(maxsize=None)
+def get_font(file: str, size: int) -> ImageFont.FreeTypeFont:
+    """
+    Get a TrueType font at a size, loaded on first use.
+
+    Fonts are shared by every renderer of the process, and keep their identity, so per-font caches
+    (like `get_max_str`'s) stay warm.
+    """
+    return ImageFont.truetype(file, size)
+
+
+@lru_cache(maxsize=None)
+def _decode_image(file: str) -> Image.Image:
+    image = Image.open(file)
+    image.load()
+
+    return image
+
+
+def get_image(file: str) -> Image.Image:
+    """Get a copy of an image, decoded from disk only once per process. The copy is safe to draw on."""
+    return _decode_image(file).copy()
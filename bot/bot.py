@@ -1,45 +1,178 @@
 import asyncio
-from os import environ, listdir
+from os import environ, getenv, listdir
 from pathlib import Path
-from typing import Callable, List
+from time import perf_counter
+from typing import Callable, Dict, List, Optional, Set
 
 import aiohttp
 import discord
-from asyncpg import create_pool
-from discord import Guild, Role
+from aiohttp import web
+from asyncpg import connect, create_pool
+from discord import Guild, Member, Role
 from discord.ext.commands import Bot, Cog, Context
 from loguru import logger
 
+from bot.database import MeteredPool
+from bot.leaderboard import Leaderboard
+from bot.metrics import CACHE_LOOKUPS, COMMAND_SECONDS, start_metrics_server
+from bot.migrations import run_migrations
+from bot.queries import STATEMENTS, Queries
+from bot.rendering import RenderExecutor
+from bot.startup import StartupProfiler
+
 
 class HolidayBot(Bot):
     """Setting up all the important things."""
 
     def __init__(self, *args, **kwargs) -> None:
+        self.startup = StartupProfiler()
         super().__init__(*args, **kwargs)
 
         self.loop = asyncio.get_event_loop()
         self.http_session = aiohttp.ClientSession()
-        self.pg_pool = self.loop.run_until_complete(
-            create_pool(
-                host="postgres",
-                database=environ["POSTGRES_DB"],
-                user=environ["POSTGRES_USER"],
-                password=environ["POSTGRES_PASSWORD"],
-            )
+
+        # Connected in `start`, alongside the gateway; queries made before then wait for it
+        self.pg_pool: Optional[MeteredPool] = None
+        self.queries = Queries()
+        self._pg_pool_task: Optional[asyncio.Task] = None
+        self._renderer_task: Optional[asyncio.Task] = None
+
+        self.metrics_server: Optional[web.AppRunner] = None
+        self.before_invoke(self.start_command_timer)
+        self.after_invoke(self.stop_command_timer)
+
+        self.leaderboard = Leaderboard()
+        self.renderer = RenderExecutor(
+            workers=int(getenv("BOT_RENDER_WORKERS", 0)) or None,
+            queue_size=int(getenv("BOT_RENDER_QUEUE_SIZE", 32)),
+            timeout=float(getenv("BOT_RENDER_TIMEOUT", 10.0)),
         )
 
+        # Host guild role IDs by name & member IDs by role ID, kept fresh by the role/member events
+        self._role_ids: Dict[str, int] = {}
+        self._role_member_ids: Dict[int, Set[int]] = {}
+
+    async def start(self, *args, **kwargs) -> None:
+        """Connect to the database & warm up the renderers concurrently with connecting to the gateway."""
+        self._pg_pool_task = self.loop.create_task(self.connect_database())
+        self._renderer_task = self.loop.create_task(self.start_renderer())
+
+        # Prometheus-format metrics on http://<host>:<port>/metrics, if a port is set
+        metrics_port = getenv("BOT_METRICS_PORT")
+
+        if metrics_port:
+            self.metrics_server = await start_metrics_server(
+                getenv("BOT_METRICS_HOST", "127.0.0.1"), int(metrics_port)
+            )
+
+        await super().start(*args, **kwargs)
+
+    async def connect_database(self) -> None:
+        """Connect the database pool, shutting the bot down if it can't."""
+        try:
+            with self.startup.time("connect database"):
+                self.pg_pool = await self.create_pg_pool()
+        except Exception:
+            logger.exception("Could not connect to the database, shutting down.")
+            self.loop.create_task(self.close())
+            return
+
+        self.queries.connect(self.pg_pool)
+
+    async def start_renderer(self) -> None:
+        """Start the render workers, which run the cogs' warm-ups (e.g. pre-rendering assets)."""
+        with self.startup.time(f"start {self.renderer.workers} render workers"):
+            await self.renderer.start()
+
     @staticmethod
-    async def on_ready() -> None:
-        """Updates the console when the bot is ready to use."""
+    async def create_pg_pool() -> MeteredPool:
+        """Bring the database schema up to date, then connect the pool."""
+        statement_cache_size = int(getenv("BOT_DB_STATEMENT_CACHE_SIZE", 100))
+
+        # A cache too small for every statement would keep evicting & re-preparing them (0 disables it)
+        if 0 < statement_cache_size < len(STATEMENTS):
+            raise ValueError(
+                f"BOT_DB_STATEMENT_CACHE_SIZE is {statement_cache_size}, "
+                f"but has to be 0 or at least {len(STATEMENTS)} (the number of statements)"
+            )
+
+        connect_kwargs = dict(
+            host=getenv("POSTGRES_HOST", "postgres"),
+            port=int(getenv("POSTGRES_PORT", 5432)),
+            database=environ["POSTGRES_DB"],
+            user=environ["POSTGRES_USER"],
+            password=environ["POSTGRES_PASSWORD"],
+            timeout=float(getenv("BOT_DB_CONNECT_TIMEOUT", 60.0)),
+            command_timeout=float(getenv("BOT_DB_COMMAND_TIMEOUT", 0)) or None,
+            statement_cache_size=statement_cache_size,
+        )
+
+        # The schema has to be up to date before the pool's connections prepare statements against it
+        conn = await connect(**connect_kwargs)
+
+        try:
+            await run_migrations(conn)
+        finally:
+            await conn.close()
+
+        pool = await create_pool(
+            min_size=int(getenv("BOT_DB_POOL_MIN_SIZE", 10)),
+            max_size=int(getenv("BOT_DB_POOL_MAX_SIZE", 10)),
+            max_inactive_connection_lifetime=float(getenv("BOT_DB_MAX_INACTIVE_LIFETIME", 300.0)),
+            **connect_kwargs,
+        )
+
+        return MeteredPool(pool)
+
+    async def on_ready(self) -> None:
+        """Updates the console when the bot is ready to use, with the startup report the first time."""
         logger.info("Awaiting...")
+        self.startup.ready()
+
+        # Role & member events may have been missed while disconnected, so the role caches start over
+        self._role_ids.clear()
+        self._role_member_ids.clear()
+
+    async def close(self) -> None:
+        """Disconnect from Discord first, then drain the database pool and close the other connection(s)."""
+        if self.is_closed():
+            return
+
+        await super().close()
 
-    async def logout(self) -> None:
-        """Subclassing the logout command to ensure connection(s) are closed properly."""
-        await asyncio.wait_for(self.http_session.close(), 30.0, loop=self.loop)
+        for task in (self._pg_pool_task, self._renderer_task):
+            if task and not task.done():
+                task.cancel()
+
+        if self.pg_pool:
+            # Let in-flight queries & transactions finish, up to a point
+            try:
+                await asyncio.wait_for(self.pg_pool.close(), float(getenv("BOT_DB_CLOSE_TIMEOUT", 10.0)))
+            except asyncio.TimeoutError:
+                logger.warning("Database connections were still busy, terminating them.")
+                self.pg_pool.terminate()
+
+        await asyncio.wait_for(self.http_session.close(), 30.0)
+        self.renderer.shutdown()
+
+        if self.metrics_server:
+            await self.metrics_server.cleanup()
 
         logger.info("Finished up closing task(s).")
 
-        return await super().logout()
+    @staticmethod
+    async def start_command_timer(ctx: Context) -> None:
+        """Note when a command started running, after its checks & argument conversion."""
+        ctx.started_at = perf_counter()
+
+    @staticmethod
+    async def stop_command_timer(ctx: Context) -> None:
+        """Record how long a command took."""
+        COMMAND_SECONDS.observe(
+            perf_counter() - ctx.started_at,
+            command=ctx.command.qualified_name,
+            outcome="error" if ctx.command_failed else "ok",
+        )
 
     @staticmethod
     def get_extensions() -> List[str]:
@@ -60,11 +193,7 @@ class HolidayBot(Bot):
 
         async def predicate(ctx: Context) -> bool:
             """Check if the user is a mod in the event host guild."""
-            host_guild = self.get_host_guild()
-            role = self.get_mod_role()
-            user = host_guild.get_member(ctx.author.id)
-
-            return True if user and role in user.roles else False
+            return self.is_mod_member(ctx.author.id)
 
         return predicate
 
@@ -72,10 +201,80 @@ class HolidayBot(Bot):
         """Get the event host guild."""
         return self.get_guild(self.get_data().HOST_GUILD)
 
+    def get_role(self, name: str) -> Optional[Role]:
+        """Get a host guild role by name, resolving its ID only once."""
+        guild = self.get_host_guild()
+        role_id = self._role_ids.get(name)
+        role = guild.get_role(role_id) if role_id else None
+
+        if not role:
+            role = discord.utils.get(guild.roles, name=name)
+
+            if role:
+                self._role_ids[name] = role.id
+
+        return role
+
+    def get_role_member_ids(self, role: Optional[Role]) -> Set[int]:
+        """Get the IDs of all members with a role, as a set."""
+        if not role:
+            return set()
+
+        member_ids = self._role_member_ids.get(role.id)
+        CACHE_LOOKUPS.inc(cache="role_members", result="miss" if member_ids is None else "hit")
+
+        if member_ids is None:
+            member_ids = {member.id for member in role.members}
+
+            # Before the bot is ready, the member list may still be incomplete
+            if self.is_ready():
+                self._role_member_ids[role.id] = member_ids
+
+        return member_ids
+
+    def is_mod_member(self, user_id: int) -> bool:
+        """Check if a user is a mod in the event host guild."""
+        return user_id in self.get_role_member_ids(self.get_mod_role())
+
+    def is_hacker_member(self, user_id: int) -> bool:
+        """Check if a user is a hacker in the event host guild."""
+        return user_id in self.get_role_member_ids(self.get_hacker_role())
+
     def get_mod_role(self) -> Role:
-        """Get all hackers."""
-        return discord.utils.get(self.get_host_guild().roles, name=self.get_data().MOD_ROLE_NAME)
+        """Get the mod role."""
+        return self.get_role(self.get_data().MOD_ROLE_NAME)
 
     def get_hacker_role(self) -> Role:
-        """Get all hackers."""
-        return discord.utils.get(self.get_host_guild().roles, name=self.get_data().HACKER_ROLE_NAME)
+        """Get the hacker role."""
+        return self.get_role(self.get_data().HACKER_ROLE_NAME)
+
+    async def on_guild_role_update(self, before: Role, after: Role) -> None:
+        """Forget the resolved role IDs when a role is renamed."""
+        if before.name != after.name:
+            self._role_ids.clear()
+
+    async def on_guild_role_delete(self, role: Role) -> None:
+        """Forget a deleted role."""
+        self._role_ids = {name: role_id for name, role_id in self._role_ids.items() if role_id != role.id}
+        self._role_member_ids.pop(role.id, None)
+
+    async def on_member_update(self, before: Member, after: Member) -> None:
+        """Keep the role membership sets up to date."""
+        if after.guild.id != self.get_data().HOST_GUILD or before.roles == after.roles:
+            return
+
+        role_ids = {role.id for role in after.roles}
+
+        for role_id, member_ids in self._role_member_ids.items():
+            if role_id in role_ids:
+                member_ids.add(after.id)
+            else:
+                member_ids.discard(after.id)
+
+    async def on_member_remove(self, member: Member) -> None:
+        """Drop a member that left from the role membership sets."""
+        if member.guild.id != self.get_data().HOST_GUILD:
+            return
+
+        for member_ids in self._role_member_ids.values():
+            member_ids.discard(member.id)
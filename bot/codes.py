@@ -0,0 +1,62 @@
+import asyncio
+from csv import reader
+from dataclasses import dataclass
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+@dataclass(frozen=True)
+class ActivityCode:
+    """A dataclass for an activity code that can be redeemed for points."""
+
+    code: str
+    title: str
+    points: int
+
+
+def read_codes_csv(path: str) -> Dict[str, ActivityCode]:
+    """Read activity codes from a `code,title,points` CSV file."""
+    with open(path, newline="") as csvfile:
+        return {
+            item[0].upper(): ActivityCode(item[0].upper(), item[1], int(item[2]))
+            for item in reader(csvfile, delimiter=",", quotechar="|")
+            if item
+        }
+
+
+class CodeCatalog:
+    """In-memory catalog of activity codes, keyed by upper-cased code."""
+
+    def __init__(self) -> None:
+        self.codes: Dict[str, ActivityCode] = {}
+        self._loaded = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __iter__(self) -> Iterator[ActivityCode]:
+        return iter(self.codes.values())
+
+    def get(self, code: str) -> Optional[ActivityCode]:
+        """Look up a code, case-insensitively."""
+        return self.codes.get(code.upper())
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the catalog has been loaded yet."""
+        return self._loaded.is_set()
+
+    def load(self, codes: Iterable[ActivityCode]) -> None:
+        """Replace the catalog contents."""
+        self.codes = {code.code: code for code in codes}
+        self._loaded.set()
+
+    async def wait_until_loaded(self) -> None:
+        """Wait until the catalog has been loaded."""
+        await self._loaded.wait()
+
+    def diff(self, codes: Dict[str, ActivityCode]) -> Tuple[List[ActivityCode], List[str]]:
+        """Get the codes to upsert and the codes to delete to turn the catalog into `codes`."""
+        upserts = [code for key, code in codes.items() if self.codes.get(key) != code]
+        deletes = [key for key in self.codes if key not in codes]
+
+        return upserts, deletes
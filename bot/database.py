@@ -0,0 +1,118 @@
+import asyncio
+from contextlib import asynccontextmanager, contextmanager
+from dataclasses import dataclass
+from functools import lru_cache
+from os import getenv
+from time import perf_counter
+from typing import Any, AsyncIterator, Dict, Iterator, List, Sequence, Tuple
+
+import asyncpg
+from loguru import logger
+
+from bot.metrics import POOL_ACQUIRE_SECONDS, QUERY_SECONDS
+
+# What a query can raise when the database is unreachable, restarting or too slow, i.e. worth retrying
+DATABASE_ERRORS = (asyncpg.PostgresError, asyncpg.InterfaceError, OSError, asyncio.TimeoutError)
+
+# Queries taking at least this long are logged, with the shape of their arguments
+SLOW_QUERY_SECONDS = float(getenv("BOT_SLOW_QUERY_MS", 100)) / 1000
+
+
+@dataclass
+class StatementStats:
+    """A dataclass for the aggregated timings of one SQL statement."""
+
+    count: int = 0
+    total: float = 0.0
+    max: float = 0.0
+
+
+class QueryStats:
+    """Per-statement query timings, across every connection."""
+
+    def __init__(self) -> None:
+        self.statements: Dict[str, StatementStats] = {}
+
+    def record(self, statement: str, elapsed: float) -> None:
+        """Add a query's timing to its statement's aggregates."""
+        stats = self.statements.get(statement)
+
+        if stats is None:
+            stats = self.statements[statement] = StatementStats()
+
+        stats.count += 1
+        stats.total += elapsed
+        stats.max = max(stats.max, elapsed)
+
+    def top(self, count: int) -> List[Tuple[str, StatementStats]]:
+        """Get the statements that took the most time in total."""
+        return sorted(self.statements.items(), key=lambda item: item[1].total, reverse=True)[:count]
+
+    def reset(self) -> None:
+        """Forget every timing."""
+        self.statements.clear()
+
+
+QUERY_STATS = QueryStats()
+
+
+@lru_cache(maxsize=256)
+def normalize(query: str) -> str:
+    """Collapse the whitespace of a query, so it fits on one line."""
+    return " ".join(query.split())
+
+
+def describe_args(args: Sequence) -> str:
+    """Describe the shape of query arguments (types and sizes), without their values."""
+
+    def shape(arg: Any) -> str:
+        if isinstance(arg, (list, tuple, str, bytes)):
+            return f"{type(arg).__name__}[{len(arg)}]"
+
+        return type(arg).__name__
+
+    return f"({', '.join(shape(arg) for arg in args)})"
+
+
+@contextmanager
+def trace(name: str, query: str, args: Sequence) -> Iterator[None]:
+    """
+    Time one of the bot's statements into the metrics & per-statement aggregates, logging it if it's slow.
+
+    Statements are traced by the code that runs them rather than by the connection, so asyncpg's own
+    queries (BEGIN/COMMIT, the reset query run as connections go back to the pool) are left out.
+    """
+    started = perf_counter()
+
+    try:
+        yield
+    finally:
+        elapsed = perf_counter() - started
+
+        QUERY_SECONDS.observe(elapsed, statement=name)
+        QUERY_STATS.record(name, elapsed)
+
+        if elapsed >= SLOW_QUERY_SECONDS:
+            logger.warning(
+                f"Slow query: {name} took {elapsed * 1000:.0f} ms "
+                f"with arguments {describe_args(args)}: {normalize(query)}"
+            )
+
+
+class MeteredPool:
+    """Wraps an asyncpg pool to time how long acquiring a connection waits."""
+
+    def __init__(self, pool: asyncpg.pool.Pool) -> None:
+        self._pool = pool
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._pool, name)
+
+    @asynccontextmanager
+    async def acquire(self, *, timeout: float = None) -> AsyncIterator[asyncpg.Connection]:
+        """Acquire a connection, as `async with pool.acquire() as conn`."""
+        started = perf_counter()
+
+        async with self._pool.acquire(timeout=timeout) as conn:
+            POOL_ACQUIRE_SECONDS.observe(perf_counter() - started)
+            yield conn
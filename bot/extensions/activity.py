@@ -1,23 +1,30 @@
 from dataclasses import dataclass
 from datetime import datetime
-from os import environ
+from io import BytesIO
+from os import environ, stat
 from pathlib import Path
 from random import randint
-from typing import List
-from csv import reader
+from time import perf_counter
+from typing import Dict, List, Optional, Tuple, Union
 
 import discord
-from asyncpg import Record
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 from discord.ext.commands import Cog, Context, Greedy, check, command
 from discord.ext.tasks import loop
+from loguru import logger
 
+from bot.assets import NUNITO_BOLD, NUNITO_EXTRABOLD, NUNITO_REGULAR, get_font
 from bot.bot import HolidayBot
-from bot.utils import get_max_str
+from bot.codes import CodeCatalog, read_codes_csv
+from bot.database import DATABASE_ERRORS
+from bot.text import get_max_str
+from bot.utils import BytesLRUCache, SingleFlight
 
-REGULAR = ImageFont.truetype("assets/fonts/Nunito/Nunito-Regular.ttf", 24)
-BOLD = ImageFont.truetype("assets/fonts/Nunito/Nunito-Bold.ttf", 24)
-EXTRABOLD = ImageFont.truetype("assets/fonts/Nunito/Nunito-ExtraBold.ttf", 24)
+# How often the in-memory leaderboard is reloaded from the database, in seconds
+LEADERBOARD_RESYNC_SECONDS = float(environ.get("BOT_LEADERBOARD_RESYNC_SECONDS", 300.0))
+
+# A leaderboard position, as (points, user_id)
+Cursor = Tuple[int, int]
 
 
 @dataclass
@@ -35,7 +42,15 @@ class Activity(Cog):
 
     def __init__(self, bot: HolidayBot) -> None:
         self.bot = bot
-        self.outdir = environ.get("BOT_OUTPUT_DIR") or "output"
+        # Debug mode: also write rendered images to this directory
+        self.outdir = environ.get("BOT_OUTPUT_DIR")
+        self.leaderboard_renders = SingleFlight()
+        self.cursors: Dict[int, Tuple[Cursor, Cursor]] = {}
+        self.code_catalog = CodeCatalog()
+        self.codes_mtime = None
+        self.leaderboard_cache = BytesLRUCache(
+            int(environ.get("BOT_LEADERBOARD_CACHE_BYTES", 8 * 1024 * 1024)), name="leaderboard"
+        )
 
         # Decorate mod methods without a decorator
         self.register_all = check(self.bot.is_mod())(self.register_all)
@@ -44,27 +59,84 @@ class Activity(Cog):
         self.give = check(self.bot.is_mod())(self.give)
         self.take = check(self.bot.is_mod())(self.take)
         self.codes = check(self.bot.is_mod())(self.codes)
+        self.cache = check(self.bot.is_mod())(self.cache)
 
-        self.populate_codes.start()
+        self.watch_codes.start()
+        self.load_leaderboard.add_exception_type(*DATABASE_ERRORS)
+        self.load_leaderboard.start()
 
-        Path(self.outdir).mkdir(parents=True, exist_ok=True)
+        if self.outdir:
+            Path(self.outdir).mkdir(parents=True, exist_ok=True)
 
     def cog_unload(self) -> None:
         """On cog unload, stop tasks as necessary."""
-        self.populate_codes.stop()
+        self.watch_codes.cancel()
+        self.load_leaderboard.cancel()
 
     @command(aliases=("top",))
-    async def leaderboard(self, ctx: Context, page: int = 1) -> None:
-        """View the activity competition leaderboard."""
+    async def leaderboard(self, ctx: Context, page: Union[int, str] = 1) -> None:
+        """View the activity competition leaderboard. Use "next" or "prev" to flip through pages."""
         now = datetime.now()
-        members = await self.get_top_members(page)
-        filename = self.render_leaderboard_image(page, members)
+        leaderboard = self.bot.leaderboard
+        await leaderboard.wait_until_loaded()
+
+        if isinstance(page, int):
+            offset = (page - 1) * 10
+        elif page.lower() in ("next", "prev"):
+            offset = self.seek_cursor(ctx.author.id, forward=page.lower() == "next")
+        else:
+            await ctx.send(f'Use "{ctx.prefix}top <page>", "{ctx.prefix}top next" or "{ctx.prefix}top prev".')
+            return
+
+        offset = max(offset, 0)
+        hackers = leaderboard.get_page(offset, 10)
+
+        # Remember the first & last hacker shown, so "next"/"prev" seek from them
+        if hackers:
+            first, last = hackers[0], hackers[-1]
+            self.cursors[ctx.author.id] = (first[2], first[1]), (last[2], last[1])
+
+        filename = f"activity_top_{offset // 10 + 1}.png"
+
+        # Pages are cached until the leaderboard changes,
+        # and concurrent requests for the same uncached page share one render
+        key = (offset, leaderboard.version)
+        image = self.leaderboard_cache.get(key)
+
+        if image is None:
+            image = await self.leaderboard_renders.do(key, lambda: self.render_page(key))
 
         embed = discord.Embed(title="Activity Challenge", color=self.bot.get_data().HACKATHON_BLUE)
         embed.set_footer(text=now.strftime("Updated at %b %d, %I:%M %p PST"))
-        embed.set_image(url=f'attachment://{filename.split("/")[-1]}')
+        embed.set_image(url=f"attachment://{filename}")
+
+        await ctx.send(embed=embed, file=discord.File(BytesIO(image), filename=filename))
+
+    def seek_cursor(self, user_id: int, forward: bool) -> int:
+        """Get the offset of the page after/before the last page a user viewed."""
+        cursor = self.cursors.get(user_id)
+
+        if not cursor:
+            return 0
+
+        (first_points, first_id), (last_points, last_id) = cursor
+
+        if forward:
+            return self.bot.leaderboard.seek(last_points, last_id)
+
+        return self.bot.leaderboard.seek(first_points, first_id, after=False) - 10
+
+    async def render_page(self, key: Tuple[int, int]) -> bytes:
+        """Render an (offset, leaderboard version) page and cache the image bytes."""
+        offset, _ = key
+        members = await self.get_top_members(offset)
+        image = await self.bot.renderer.submit(
+            render_leaderboard_image, self.outdir, offset // 10 + 1, members
+        )
+
+        self.leaderboard_cache.put(key, image)
 
-        await ctx.send(embed=embed, file=discord.File(filename))
+        return image
 
     @command()
     async def redeem(self, ctx: Context, code: str) -> None:
@@ -79,45 +151,32 @@ class Activity(Cog):
             )
             return
 
-        code = code.upper()
-
-        async with self.bot.pg_pool.acquire() as conn:
-            async with conn.transaction():
-                db_user = await conn.fetchrow("SELECT * FROM Users WHERE user_id = $1", ctx.author.id)
-
-                if not db_user:
-                    await ctx.send("You are not registered for the hackathon!")
-                    return
-
-                db_code = await conn.fetchrow("SELECT * FROM Codes WHERE code = $1", code)
-
-                if code in db_user["special_codes"]:
-                    await ctx.send(
-                        (
-                            f"You have already redeemed points for the activity \"{db_code['title']}\"."
-                            "Try something else!"
-                        )
-                    )
-                    return
-
-                if not db_code:
-                    await ctx.send(f"Activity code '{code}' not found! Are you sure it is correct?")
-                    return
-
-                await conn.execute(
-                    """
-                    UPDATE Users
-                    SET points=$2,
-                        special_codes = array_append(special_codes, $3)
-                    WHERE user_id=$1
-                    """,
-                    db_user["user_id"],
-                    db_user["points"] + db_code["points"],
-                    db_code["code"],
+        await self.code_catalog.wait_until_loaded()
+        activity_code = self.code_catalog.get(code)
+
+        if not activity_code:
+            await ctx.send(f"Activity code '{code.upper()}' not found! Are you sure it is correct?")
+            return
+
+        registered, points = await self.bot.queries.redeem(ctx.author.id, activity_code)
+
+        if not registered:
+            await ctx.send("You are not registered for the hackathon!")
+            return
+
+        if points is None:
+            await ctx.send(
+                (
+                    f'You have already redeemed points for the activity "{activity_code.title}".'
+                    "Try something else!"
                 )
+            )
+            return
+
+        self.bot.leaderboard.update(ctx.author.id, points)
 
         await ctx.send(
-            f"{ctx.author.mention} redeemed {db_code['points']} points for \"{db_code['title']}\"!"
+            f'{ctx.author.mention} redeemed {activity_code.points} points for "{activity_code.title}"!'
         )
 
     @command(hidden=True)
@@ -132,28 +191,16 @@ class Activity(Cog):
             await ctx.send("At least one user has to be specified!")
             return
 
-        users_updated = []
-        users_not_registered = []
-
-        async with self.bot.pg_pool.acquire() as conn:
-            async with conn.transaction():
-                for user in users:
-                    db_user = await conn.fetchrow("SELECT * FROM Users WHERE user_id = $1", user.id)
-
-                    if not db_user:
-                        users_not_registered.append(user.mention)
-                        continue
-
-                    await conn.execute(
-                        """
-                        UPDATE Users
-                        SET points = points + $2
-                        WHERE user_id=$1
-                        """,
-                        user.id,
-                        points,
-                    )
-                    users_updated.append(user.mention)
+        # Users it didn't update are not registered
+        new_points = await self.bot.queries.give_points(list({user.id for user in users}), points)
+
+        for user_id, user_points in new_points.items():
+            self.bot.leaderboard.update(user_id, user_points)
+
+        users_updated = list(dict.fromkeys(user.mention for user in users if user.id in new_points))
+        users_not_registered = list(
+            dict.fromkeys(user.mention for user in users if user.id not in new_points)
+        )
 
         text = ""
 
@@ -177,7 +224,6 @@ class Activity(Cog):
         """Register a user for the hackathon."""
         host_guild = self.bot.get_host_guild()
         hacker_role = self.bot.get_hacker_role()
-        mod_role = self.bot.get_mod_role()
         member = host_guild.get_member(user.id)
 
         if not member:
@@ -188,20 +234,9 @@ class Activity(Cog):
         await member.add_roles(hacker_role)
 
         # if not a @mod, add to the activity competition
-        if mod_role not in member.roles:
-            async with self.bot.pg_pool.acquire() as conn:
-                db_user = await conn.fetchrow(
-                    "SELECT points FROM Users WHERE user_id = $1",
-                    member.id,
-                )
-
-                if not db_user:
-                    await conn.execute(
-                        "INSERT INTO Users(user_id, points, special_codes) VALUES ($1, $2, $3)",
-                        member.id,
-                        0,
-                        [],
-                    )
+        if not self.bot.is_mod_member(member.id):
+            if await self.bot.queries.register_user(member.id):
+                self.bot.leaderboard.update(member.id, 0)
 
         await ctx.send(
             f'{member.mention} is now a hacker! Profile @ "{ctx.prefix} profile {member.mention}".'
@@ -220,185 +255,255 @@ class Activity(Cog):
 
         await member.remove_roles(hacker_role)
 
-        async with self.bot.pg_pool.acquire() as conn:
-            await conn.execute(
-                "DELETE FROM Users WHERE user_id = $1",
-                member.id,
-            )
+        await self.bot.queries.unregister_user(member.id)
+        self.bot.leaderboard.remove(member.id)
 
         await ctx.send(f"{member.mention} is no longer a hacker :cry:")
 
     @command(hidden=True)
     async def register_all(self, ctx: Context, fill_random: bool = False) -> None:
         """Reset and register all @hacker for the activity competition."""
+        started = perf_counter()
         users = await self.populate_db(fill_random)
+        elapsed = perf_counter() - started
 
-        text = "Registered & reset: " + " ".join([f"<@{user['user_id']}>" for user in users])
+        logger.info(f"Registered {len(users)} hackers in {elapsed * 1000:.0f}ms")
+
+        text = "Registered & reset: " + " ".join([f"<@{user_id}>" for user_id, _ in users])
         text += "\nPopulated random scores" if fill_random else "\nSet all scores to 0"
         embed = discord.Embed(title="Hackers", description=text)
+        embed.set_footer(text=f"{len(users)} hackers registered in {elapsed * 1000:.0f}ms")
 
         await ctx.send(embed=embed)
 
     @command(hidden=True)
     async def codes(self, ctx: Context) -> None:
         """List all activity codes."""
-        async with self.bot.pg_pool.acquire() as conn:
-            async with conn.transaction():
-                codes = await conn.fetch("SELECT code, title, points FROM Codes")
+        await self.code_catalog.wait_until_loaded()
 
         embed = discord.Embed(
             title="Activity Codes",
-            description="\n".join([f"`{code}` {title} - {points}" for code, title, points in codes]),
+            description="\n".join(
+                [f"`{code.code}` {code.title} - {code.points}" for code in self.code_catalog]
+            ),
             color=self.bot.get_data().HACKATHON_BLUE,
         )
 
         await ctx.author.send(embed=embed)
 
-    @loop(count=1)
-    async def populate_codes(self) -> None:
-        """Populate activity codes into the database."""
-        async with self.bot.pg_pool.acquire() as conn:
-            with open(self.bot.get_data().ACTIVITY_CODES_CSV, newline="") as csvfile:
-                data = [
-                    (item[0], item[1], int(item[2])) for item in reader(csvfile, delimiter=",", quotechar="|")
-                ]
+    @command(hidden=True)
+    async def cache(self, ctx: Context) -> None:
+        """Show leaderboard image cache statistics."""
+        await ctx.send(f"Leaderboard cache: {self.leaderboard_cache.stats()}")
+
+    @Cog.listener()
+    async def on_member_update(self, before: discord.Member, after: discord.Member) -> None:
+        """Drop cached leaderboard pages when a hacker's shown name changes."""
+        if before.display_name != after.display_name and after.id in self.bot.leaderboard:
+            self.leaderboard_cache.clear()
+
+    @Cog.listener()
+    async def on_user_update(self, before: discord.User, after: discord.User) -> None:
+        """Drop cached leaderboard pages when a hacker's username changes."""
+        if before.name != after.name and after.id in self.bot.leaderboard:
+            self.leaderboard_cache.clear()
+
+    @loop(seconds=10.0)
+    async def watch_codes(self) -> None:
+        """Sync activity codes from the CSV file into the catalog & database whenever it changes."""
+        path = self.bot.get_data().ACTIVITY_CODES_CSV
+
+        # Start from what's already in the table, so only the changes are written (retried every loop)
+        if not self.code_catalog.loaded:
+            started = perf_counter()
+
+            try:
+                self.code_catalog.load(await self.bot.queries.get_codes())
+            except DATABASE_ERRORS as e:
+                logger.warning(f"Could not load activity codes from the database: {e!r}")
+                return
+
+            self.bot.startup.record("load activity codes", perf_counter() - started)
+
+        try:
+            mtime = stat(path).st_mtime_ns
+
+            if mtime == self.codes_mtime:
+                return
+
+            codes = read_codes_csv(path)
+        except (OSError, ValueError, IndexError) as e:
+            logger.warning(f"Could not read activity codes from '{path}': {e}")
+            return
 
-            async with conn.transaction():
-                await conn.execute("DELETE FROM Codes")
-                await conn.executemany("INSERT INTO Codes (code, title, points) VALUES ($1, $2, $3)", data)
+        upserts, deletes = self.code_catalog.diff(codes)
+
+        try:
+            await self.bot.queries.sync_codes(upserts, deletes)
+        except DATABASE_ERRORS as e:
+            logger.warning(f"Could not sync activity codes to the database: {e!r}")
+            return
 
-    async def populate_db(self, fill_random: bool) -> List[Record]:
+        self.code_catalog.load(codes.values())
+        self.codes_mtime = mtime
+
+        if upserts or deletes:
+            logger.info(f"Synced activity codes: {len(upserts)} added or changed, {len(deletes)} removed")
+
+    @loop(seconds=LEADERBOARD_RESYNC_SECONDS)
+    async def load_leaderboard(self) -> None:
+        """
+        Load the in-memory leaderboard from the database, then resync it every so often.
+
+        Concurrent updates to one hacker's points can be answered out of order, leaving the index with
+        the older total; a resync puts it right, unless points changed while it was fetching.
+        """
+        started = perf_counter()
+        version = self.bot.leaderboard.version
+
+        try:
+            users = await self.bot.queries.get_leaderboard()
+        except DATABASE_ERRORS as e:
+            # Commands wait for the first load, so the loop retries it, with exponential backoff
+            logger.warning(f"Could not load the leaderboard, retrying: {e!r}")
+            raise
+
+        if not self.bot.leaderboard.loaded:
+            self.bot.startup.record("load leaderboard", perf_counter() - started)
+        elif self.bot.leaderboard.version != version:
+            # The fetched totals may be older than the updates made meanwhile, so leave it to the next resync
+            logger.debug("The leaderboard changed while resyncing it, skipping this resync.")
+            return
+
+        self.bot.leaderboard.load(users)
+
+    async def populate_db(self, fill_random: bool) -> List[Tuple[int, int]]:
         """Reset & populate the postgres Users table with @hacker members + random scores."""
         hacker_role = self.bot.get_hacker_role()
-        mod_role = self.bot.get_mod_role()
-
-        async with self.bot.pg_pool.acquire() as conn:
-            async with conn.transaction():
-                await conn.execute("DELETE FROM Users")
-
-                for member in hacker_role.members:
-                    if member not in mod_role.members:
-                        await conn.execute(
-                            "INSERT INTO Users(user_id, points, special_codes) VALUES ($1, $2, $3)",
-                            member.id,
-                            randint(0, 200) if fill_random else 0,
-                            [],
-                        )
-
-            async with conn.transaction():
-                users = await conn.fetch("SELECT * FROM Users")
-                return users
-
-    async def get_top_members(self, page: int) -> List[RankedMember]:
-        """Get top 10 members on page X of the leaderboard."""
-        guild = self.bot.get_host_guild()
+        mod_ids = self.bot.get_role_member_ids(self.bot.get_mod_role())
 
-        page_idx = page - 1
-        page_offset = page_idx * 10
+        users = [
+            (member.id, randint(0, 200) if fill_random else 0)
+            for member in hacker_role.members
+            if member.id not in mod_ids
+        ]
 
-        async with self.bot.pg_pool.acquire() as conn:
-            async with conn.transaction():
-                hackers = await conn.fetch(
-                    "SELECT * FROM Users ORDER BY points DESC, user_id DESC LIMIT 10 OFFSET $1",
-                    page_offset,
-                )
+        await self.bot.queries.reset_users(users)
+
+        self.bot.leaderboard.load(users)
+
+        return users
 
-        # Tuples of (rank, DB user, and Discord Guild Member)
+    async def get_top_members(self, offset: int) -> List[RankedMember]:
+        """Get the 10 members of the leaderboard starting at a 0-based offset."""
+        guild = self.bot.get_host_guild()
+        leaderboard = self.bot.leaderboard
+
+        # Served from the in-memory leaderboard, which every points mutation keeps up to date
+        await leaderboard.wait_until_loaded()
+        hackers = leaderboard.get_page(offset, 10)
+
+        # Tuples of (rank, user ID, points, and Discord Guild Member)
         hacker_data = [
-            (page_offset + i + 1, hacker, guild.get_member(hacker["user_id"]))
-            for i, hacker in enumerate(hackers)
+            (rank, user_id, points, guild.get_member(user_id)) for rank, user_id, points in hackers
         ]
 
         return [
             RankedMember(
                 rank=rank,
-                username=member.name if member else str(db_user["user_id"]),
-                display_name=member.display_name if member else str(db_user["user_id"]),
-                score=db_user["points"],
+                username=member.name if member else str(user_id),
+                display_name=member.display_name if member else str(user_id),
+                score=points,
             )
-            for rank, db_user, member in hacker_data
+            for rank, user_id, points, member in hacker_data
         ]
 
-    def render_leaderboard_image(self, page: int, members: List[RankedMember]) -> str:
-        """Renders the leaderboard image."""
-        height = 600
-        width = 580
-        outfile = f"{self.outdir}/activity_top_{page}.png"
 
-        image = Image.new(mode="RGBA", size=(height, width), color=(0, 0, 0, 0))
-        draw = ImageDraw.Draw(image)
+def render_leaderboard_image(outdir: Optional[str], page: int, members: List[RankedMember]) -> bytes:
+    """Renders the leaderboard image. Runs in a render worker process."""
+    height = 600
+    width = 580
 
-        step_size = int(image.height / 10)
-        box_padding = 6
-        box_height = 52
-        content_padding = 24
-        content_offset_y = 10
+    regular = get_font(NUNITO_REGULAR, 24)
+    bold = get_font(NUNITO_BOLD, 24)
+    extrabold = get_font(NUNITO_EXTRABOLD, 24)
 
-        y = 4
+    image = Image.new(mode="RGBA", size=(height, width), color=(0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
 
-        for person in members:
-            # Draw bounding rectangle
-            draw.rectangle(
-                [(box_padding, y), (width - box_padding, y + box_height)],
-                fill=(73, 76, 81),
-            )
+    step_size = int(image.height / 10)
+    box_padding = 6
+    box_height = 52
+    content_padding = 24
+    content_offset_y = 10
 
-            content_y = y + content_offset_y
+    y = 4
 
-            # Show rank number: '#' then '24'
-            draw.text(
-                (content_padding, content_y),
-                "#",
-                font=BOLD,
-                fill=(200, 200, 200),
-            )
-            draw.text(
-                (content_padding + 18, content_y),
-                str(person.rank),
-                font=BOLD,
-                fill=(200, 200, 200),
-            )
+    for person in members:
+        # Draw bounding rectangle
+        draw.rectangle(
+            [(box_padding, y), (width - box_padding, y + box_height)],
+            fill=(73, 76, 81),
+        )
 
-            # Show display name (or username, if default)
-            name_x = content_padding + 58
-            content_width = width - name_x - content_padding - 58
+        content_y = y + content_offset_y
 
-            display_name, display_name_length = get_max_str(EXTRABOLD, person.display_name, content_width)
-            draw.text(
-                (name_x, content_y),
-                display_name,
-                font=EXTRABOLD,
-            )
+        # Show rank number: '#' then '24'
+        draw.text(
+            (content_padding, content_y),
+            "#",
+            font=bold,
+            fill=(200, 200, 200),
+        )
+        draw.text(
+            (content_padding + 18, content_y),
+            str(person.rank),
+            font=bold,
+            fill=(200, 200, 200),
+        )
 
-            # Show username, if different from display name
-            if person.username != person.display_name:
-                username, _ = get_max_str(
-                    REGULAR, f"@{person.username}", content_width - display_name_length - 8
-                )
-                draw.text(
-                    (name_x + display_name_length + 8, content_y),
-                    username,
-                    font=REGULAR,
-                )
+        # Show display name (or username, if default)
+        name_x = content_padding + 58
+        content_width = width - name_x - content_padding - 58
+
+        display_name, display_name_length = get_max_str(extrabold, person.display_name, content_width)
+        draw.text(
+            (name_x, content_y),
+            display_name,
+            font=extrabold,
+        )
 
-            # Show score, right aligned
+        # Show username, if different from display name
+        if person.username != person.display_name:
+            username, _ = get_max_str(regular, f"@{person.username}", content_width - display_name_length - 8)
             draw.text(
-                (width - content_padding, content_y),
-                str(person.score),
-                font=BOLD,
-                fill=(118, 181, 214),
-                anchor="ra",
+                (name_x + display_name_length + 8, content_y),
+                username,
+                font=regular,
             )
 
-            y += step_size
+        # Show score, right aligned
+        draw.text(
+            (width - content_padding, content_y),
+            str(person.score),
+            font=bold,
+            fill=(118, 181, 214),
+            anchor="ra",
+        )
+
+        y += step_size
+
+    del draw
 
-        del draw
+    buffer = BytesIO()
+    image.save(buffer, format="PNG")
 
-        image.save(outfile)
+    del image
 
-        del image
+    if outdir:
+        Path(f"{outdir}/activity_top_{page}.png").write_bytes(buffer.getvalue())
 
-        return outfile
+    return buffer.getvalue()
 
 
 def setup(bot: HolidayBot) -> None:
@@ -1,10 +1,11 @@
-from typing import Optional
+from typing import Optional, Union
 
 from discord import Activity, ActivityType
 from discord.ext.commands import Cog, Context, command, errors
 from loguru import logger
 
 from bot.bot import HolidayBot
+from bot.database import QUERY_STATS
 
 
 class Admin(Cog, command_attrs=dict(hidden=True)):
@@ -40,6 +41,33 @@ class Admin(Cog, command_attrs=dict(hidden=True)):
             f"Extension '{ext_name}' was reloaded." if ext_name else "All extensions were reloaded."
         )
 
+    @command(aliases=("q",))
+    async def queries(self, ctx: Context, count: Union[int, str] = 5) -> None:
+        """Shows the statements that took the most database time, or resets the timings with "reset"."""
+        if isinstance(count, str):
+            if count.lower() != "reset":
+                await ctx.send(f'Use "{ctx.prefix}queries <count>" or "{ctx.prefix}queries reset".')
+                return
+
+            QUERY_STATS.reset()
+            await ctx.send("Query timings were reset.")
+            return
+
+        top = QUERY_STATS.top(min(max(count, 1), 10))
+
+        if not top:
+            await ctx.send("No queries were timed yet.")
+            return
+
+        lines = [f"{'count':>7} {'total ms':>10} {'avg ms':>8} {'max ms':>8}  statement"]
+        lines += [
+            f"{stats.count:>7} {stats.total * 1000:>10.1f} {stats.total / stats.count * 1000:>8.2f} "
+            f"{stats.max * 1000:>8.2f}  {statement}"
+            for statement, stats in top
+        ]
+
+        await ctx.send("```\n" + "\n".join(lines) + "\n```")
+
 
 def setup(bot: HolidayBot) -> None:
     """The necessary function for loading the Admin cog."""
@@ -1,10 +1,30 @@
+import asyncio
 from datetime import datetime
+from hashlib import sha256
+from json import dumps, loads
+from os import environ
+from pathlib import Path
+from tempfile import gettempdir
+from time import perf_counter
+from typing import List, Optional, Tuple
 
+import aiohttp
 import discord
 from discord.ext import tasks
 from discord.ext.commands import Cog, Context, command
+from loguru import logger
 
 from bot.bot import HolidayBot
+from bot.metrics import CACHE_LOOKUPS, SCHEDULE_FETCH_SECONDS
+
+# Polling backs off while the schedule is unchanged, and speeds up again when it changes
+POLL_INTERVAL_MIN = 60.0
+POLL_INTERVAL_MAX = 600.0
+
+# Last-known-good schedule, served right away after a restart while a fresh copy is fetched
+SNAPSHOT_PATH = Path(
+    environ.get("BOT_SCHEDULE_SNAPSHOT", Path(gettempdir()) / "holiday-hackathon-schedule.json")
+)
 
 
 class Event(Cog):
@@ -14,6 +34,17 @@ class Event(Cog):
         self.bot = bot
         self.event_data = None
         self.update_time = None
+
+        # Conditional GET validators & hash of the last schedule payload
+        self.etag = None
+        self.last_modified = None
+        self.payload_hash = None
+
+        # Built from event_data once per payload change
+        self.schedule_fields: List[Tuple[str, str]] = []
+        self.schedule_embed: Optional[discord.Embed] = None
+
+        self.load_snapshot()
         self.fetch_schedule.start()
 
     def cog_unload(self) -> None:
@@ -27,6 +58,15 @@ class Event(Cog):
             await ctx.send("I'm still fetching the event data. Try again in a few seconds!")
             return
 
+        CACHE_LOOKUPS.inc(cache="schedule_embed", result="hit" if self.schedule_embed else "miss")
+
+        if not self.schedule_embed:
+            self.schedule_embed = self.build_embed()
+
+        await ctx.send(embed=self.schedule_embed)
+
+    def build_embed(self) -> discord.Embed:
+        """Build the schedule embed from the cached fields."""
         formatted_time = self.update_time.strftime("Updated at %b %d, %I:%M %p PST")
         embed = (
             discord.Embed(
@@ -41,28 +81,118 @@ class Event(Cog):
             .set_footer(text=f"{formatted_time} | More at {self.bot.get_data().WEBSITE_URL}")
         )
 
-        for day_info in self.event_data["schedule"]:
-            events_text = ""
+        for name, value in self.schedule_fields:
+            embed.add_field(name=name, value=value, inline=False)
+
+        return embed
+
+    def load_snapshot(self) -> None:
+        """Load the last-known-good schedule from disk, if there is one."""
+        try:
+            snapshot = loads(SNAPSHOT_PATH.read_text())
+            self.update_schedule(snapshot["data"], datetime.fromisoformat(snapshot["fetched_at"]))
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            logger.info(f"No schedule snapshot loaded: {e!r}")
+            return
+
+        self.etag = snapshot.get("etag")
+        self.last_modified = snapshot.get("last_modified")
+        self.payload_hash = snapshot.get("payload_hash")
+
+    def save_snapshot(self) -> None:
+        """Save the current schedule to disk."""
+        snapshot = {
+            "fetched_at": self.update_time.isoformat(),
+            "etag": self.etag,
+            "last_modified": self.last_modified,
+            "payload_hash": self.payload_hash,
+            "data": self.event_data,
+        }
+
+        try:
+            SNAPSHOT_PATH.write_text(dumps(snapshot))
+        except OSError as e:
+            logger.warning(f"Could not save the schedule snapshot: {e}")
+
+    def update_schedule(self, event_data: dict, update_time: Optional[datetime] = None) -> None:
+        """Replace the schedule, rebuilding the embed fields. Raises ValueError if it's not shaped right."""
+        fields = []
 
-            for event in day_info["events"]:
-                # TODO: add better fields
-                cleaned_time = event["time"].replace("&nbsp;", "").strip()
-                events_text += f'` {cleaned_time.ljust(14)} ` {event["title"]}\n'
+        # e.g. {"schedule": null}, a top-level list or a non-string time, from a website deploy gone wrong
+        try:
+            for day_info in event_data["schedule"]:
+                events_text = ""
 
-            embed.add_field(name=day_info["day"], value=events_text, inline=False)
+                for event in day_info["events"]:
+                    # TODO: add better fields
+                    cleaned_time = event["time"].replace("&nbsp;", "").strip()
+                    events_text += f'` {cleaned_time.ljust(14)} ` {event["title"]}\n'
 
-        await ctx.send(embed=embed)
+                fields.append((day_info["day"], events_text))
+        except (KeyError, IndexError, TypeError, AttributeError) as e:
+            raise ValueError(f"Unexpected schedule shape: {e!r}") from None
 
-    @tasks.loop(seconds=60.0)
+        self.event_data = event_data
+        self.schedule_fields = fields
+        self.schedule_embed = None
+        self.update_time = update_time or datetime.now()
+
+    @tasks.loop(seconds=POLL_INTERVAL_MIN)
     async def fetch_schedule(self) -> None:
-        """Fetches the schedule from the hackathon website."""
-        async with self.bot.http_session.get(self.bot.get_data().API_SCHEDULE_URL) as response:
-            if response.status == 200:
-                self.update_time = datetime.now()
-                self.event_data = await response.json()
-            else:
-                # TODO: better error handling
-                raise RuntimeError
+        """Fetches the schedule from the hackathon website, if it changed."""
+        started = perf_counter()
+
+        try:
+            changed = await self.revalidate_schedule()
+            result = "changed" if changed else "unchanged"
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+            # Keep serving the last-known-good schedule, and back off until the website recovers
+            logger.warning(f"Could not fetch the schedule: {e!r}")
+            changed = False
+            result = "error"
+
+        elapsed = perf_counter() - started
+        SCHEDULE_FETCH_SECONDS.observe(elapsed, result=result)
+
+        if self.fetch_schedule.current_loop == 0:
+            self.bot.startup.record(f"fetch schedule ({result})", elapsed)
+
+        interval = POLL_INTERVAL_MIN if changed else min(self.fetch_schedule.seconds * 2, POLL_INTERVAL_MAX)
+
+        if interval != self.fetch_schedule.seconds:
+            self.fetch_schedule.change_interval(seconds=interval)
+
+    async def revalidate_schedule(self) -> bool:
+        """Conditionally fetch the schedule, returning whether it changed."""
+        headers = {}
+
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+
+        async with self.bot.http_session.get(
+            self.bot.get_data().API_SCHEDULE_URL, headers=headers, raise_for_status=True
+        ) as response:
+            if response.status == 304:
+                return False
+
+            payload = await response.read()
+            payload_hash = sha256(payload).hexdigest()
+            changed = payload_hash != self.payload_hash
+
+            if changed:
+                self.update_schedule(loads(payload))
+
+            self.etag = response.headers.get("ETag")
+            self.last_modified = response.headers.get("Last-Modified")
+            self.payload_hash = payload_hash
+
+        if changed:
+            self.save_snapshot()
+
+        return changed
 
 
 def setup(bot: HolidayBot) -> None:
@@ -1,20 +1,25 @@
+from io import BytesIO
 from os import environ
 from pathlib import Path
-from typing import List, Optional, Tuple
-from random import randint
+from typing import Dict, List, Optional, Tuple
+from random import choice, randint
 
-from asyncpg import Record
 from discord import File, Member, User
 from discord.ext.commands import Cog, Context, command
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image, ImageDraw
 
+from bot.assets import NUNITO_BOLD, NUNITO_REGULAR, PROFILE_BACKGROUND, get_font, get_image
 from bot.bot import HolidayBot
-from bot.utils import get_max_str
+from bot.text import get_max_str
+from bot.utils import SingleFlight
 
-BOLD_LARGEST = ImageFont.truetype("assets/fonts/Nunito/Nunito-Bold.ttf", 28)
-BOLD_LARGE = ImageFont.truetype("assets/fonts/Nunito/Nunito-Bold.ttf", 26)
-BOLD = ImageFont.truetype("assets/fonts/Nunito/Nunito-Bold.ttf", 24)
-REGULAR = ImageFont.truetype("assets/fonts/Nunito/Nunito-Regular.ttf", 18)
+RECENT_ACTIVITY_COUNT = 2
+SNOW_VARIANTS = 4
+SNOW_FRAMES = 10
+
+# Pre-rendered snow overlay sequences and the palette shared by every animated card (per process)
+_snow_bank: List[List[Image.Image]] = []
+_gif_palette: Optional[Image.Image] = None
 
 
 class Profile(Cog):
@@ -22,9 +27,15 @@ class Profile(Cog):
 
     def __init__(self, bot: HolidayBot) -> None:
         self.bot = bot
-        self.outdir = environ.get("BOT_OUTPUT_DIR") or "output"
+        # Debug mode: also write rendered images to this directory
+        self.outdir = environ.get("BOT_OUTPUT_DIR")
+        self.profile_renders = SingleFlight()
+
+        # Pre-render the snow in every render worker as it starts, instead of here
+        self.bot.renderer.add_warm_up(load_snow_bank)
 
-        Path(self.outdir).mkdir(parents=True, exist_ok=True)
+        if self.outdir:
+            Path(self.outdir).mkdir(parents=True, exist_ok=True)
 
     @command()
     async def profile(self, ctx: Context, user: Optional[User], *, flags: str = "") -> None:
@@ -32,193 +43,245 @@ class Profile(Cog):
         flags = flags.split(" ")
         user = user or ctx.author
         host_guild = self.bot.get_host_guild()
-        hacker_role = self.bot.get_hacker_role()
         member = host_guild.get_member(user.id)
 
         if not member:
             await ctx.send("User not found!")
             return
 
-        if hacker_role not in member.roles:
+        if not self.bot.is_hacker_member(member.id):
             await ctx.send(f"{user.mention} is not registered for the hackathon!")
             return
 
-        # Note: user_data may be None
-        user_data, codes = await self.get_member_data(member)
+        leaderboard = self.bot.leaderboard
+        await leaderboard.wait_until_loaded()
 
-        filename = self.render_profile_image(
-            member,
-            user_data,
-            codes,
-            flags=flags,
-        )
+        # Concurrent requests for an identical card share one query & one render. Every change in points
+        # (including a redemption, which also changes the recent activity) bumps the leaderboard version.
+        key = (member.id, member.name, member.display_name, leaderboard.version, tuple(flags))
+        image = await self.profile_renders.do(key, lambda: self.render_profile(member, flags))
+        filename = f"profile_{member.name}.{'png' if 'static' in flags else 'gif'}"
 
         await ctx.send(
-            f"**{'Your hacker' if user == ctx.author else 'Hacker'} profile**", file=File(filename)
+            f"**{'Your hacker' if user == ctx.author else 'Hacker'} profile**",
+            file=File(BytesIO(image), filename=filename),
+        )
+
+    async def render_profile(self, member: Member, flags: List[str]) -> bytes:
+        """Get a hacker's profile data and render their card."""
+        # Note: user_data may be None
+        user_data, codes = await self.get_member_data(member)
+        member_data = {"name": member.name, "display_name": member.display_name}
+
+        return await self.bot.renderer.submit(
+            render_profile_image, self.outdir, member_data, user_data, codes, flags
         )
 
-    async def get_member_data(self, member: Member) -> Tuple[Record, List[Record]]:
+    async def get_member_data(self, member: Member) -> Tuple[Optional[dict], List[str]]:
         """Get activity data for a user."""
-        async with self.bot.pg_pool.acquire() as conn:
-            # TODO: optimize this query or find an alterative method to calculate rank
-            user = await conn.fetchrow(
-                """
-                SELECT
-                    points,
-                    (
-                        SELECT COUNT(user_id)
-                        FROM users as inner_users
-                        WHERE (inner_users.points > users.points)
-                           OR (inner_users.points = users.points AND inner_users.user_id > users.user_id)
-                    ) + 1 as rank
-                FROM Users
-                WHERE user_id = $1
-                """,
-                member.id,
+        leaderboard = self.bot.leaderboard
+        await leaderboard.wait_until_loaded()
+
+        # Points & rank come from the in-memory rank index instead of a per-request rank query
+        points = leaderboard.get_points(member.id)
+        user = {"points": points, "rank": leaderboard.get_rank(member.id)} if points is not None else None
+
+        return user, await self.bot.queries.get_recent_activities(member.id, RECENT_ACTIVITY_COUNT)
+
+
+def render_snow_layers(width: int, height: int) -> List[Image.Image]:
+    """Renders one sequence of transparent snow animation frames."""
+    points = []
+    scatter_amount = 20
+    min_radius = 6
+    max_radius = 10
+
+    # Create initial points for snow
+    for i in range(0, width, int(width / 4)):
+        for j in range(0, height, int(height / 4)):
+            points.append(
+                (
+                    i + randint(-1 * scatter_amount, scatter_amount),
+                    j + randint(-1 * scatter_amount * 2, scatter_amount * 2),
+                    randint(min_radius, max_radius),
+                    randint(80, 130),
+                )
             )
-            # NOTE: Fetching codes is currently disabled
-            # because the 'recent activity' list is not shown
-            # codes = await conn.fetch(
-            #     """
-            #     SELECT Codes.title
-            #     FROM Users
-            #     JOIN Codes
-            #     ON Codes.code = ANY (Users.special_codes)
-            #     WHERE user_id = $1
-            #     """, member.id
-            # )
-
-        # return user, codes
-        return user, None
-
-    def render_profile_image(
-        self, member: Member, user: Optional[Record], codes: List[Record], flags: List[str]
-    ) -> str:
-        """Renders the profile image."""
-        animated = "static" not in flags
-        center = "left" not in flags
-
-        outfile = f"{self.outdir}/profile_{member.name}.{'gif' if animated else 'png'}"
-
-        image = Image.open("assets/img/profile_card_bg.png")
-        draw = ImageDraw.Draw(image)
-        width, height = image.size
-
-        if center:
-            has_display_name = member.name != member.display_name
-            text_padding = 12
-
-            # Display name
-            display_name, _ = get_max_str(BOLD_LARGEST, member.display_name, width - (text_padding * 2))
-            draw.text(
-                (width / 2, 70 if has_display_name else 80),
-                display_name,
-                font=BOLD_LARGEST,
-                fill=(20, 20, 20),
-                anchor="ma",
+
+    frames = []
+
+    # Create snow animation frames
+    for i in range(SNOW_FRAMES):
+        overlay = Image.new("RGBA", (width, height), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(overlay)
+
+        # Draw points for snow
+        for x, y, radius, opacity in points:
+            offset_x = randint(-10, 10)
+            offset_y = i * 13
+            offset_y = randint(offset_y - 5, offset_y + 5)
+
+            draw.ellipse(
+                (
+                    ((x + offset_x) % width - radius, (y + offset_y) % height - radius),
+                    ((x + offset_x) % width + radius, (y + offset_y) % height + radius),
+                ),
+                fill=(255, 255, 255, opacity),
             )
 
-            # Username, if different from display name
-            if has_display_name:
-                username_str, _ = get_max_str(REGULAR, f"@{member.name}", width - (text_padding * 2))
-                draw.text((width / 2, 120), username_str, font=REGULAR, fill=(50, 50, 50), anchor="ma")
+        del draw
 
-            # Points & rank
-            draw.text(
-                (width / 2, 170 if has_display_name else 150),
-                f"{user['points'] or 'No'} points{' yet' if not user['points'] else ''} · #{user['rank']}"
-                if user
-                else "On the @mod team",
-                font=BOLD,
-                fill=(20, 20, 20),
-                anchor="ma",
-            )
+        frames.append(overlay)
+
+    return frames
+
+
+def load_snow_bank() -> None:
+    """Pre-renders the snow layer variants and the GIF palette, once per process."""
+    global _gif_palette
+
+    if _snow_bank:
+        return
+
+    background = get_image(PROFILE_BACKGROUND)
+    _snow_bank.extend(render_snow_layers(*background.size) for _ in range(SNOW_VARIANTS))
+
+    # Build the palette from a snowy card plus a ramp of the dark text colors
+    sample = Image.alpha_composite(background, _snow_bank[0][0]).convert("RGB")
+    draw = ImageDraw.Draw(sample)
 
-        else:
-            # Display name
-            display_name, _ = get_max_str(BOLD_LARGE, member.display_name, width - 20 - 70)
-            draw.text((20, 110), display_name, font=BOLD_LARGE, fill=(20, 20, 20), anchor="ls")
-            # Rank
+    for x in range(0, 236):
+        shade = 20 + x
+        draw.line(((x, 0), (x, 24)), fill=(shade, shade, shade))
+
+    del draw
+
+    _gif_palette = sample.quantize(colors=128)
+
+
+def render_profile_image(
+    outdir: Optional[str], member: Dict[str, str], user: Optional[dict], codes: List[str], flags: List[str]
+) -> bytes:
+    """Renders the profile image. Runs in a render worker process."""
+    animated = "static" not in flags
+    center = "left" not in flags
+
+    buffer = BytesIO()
+
+    bold_largest = get_font(NUNITO_BOLD, 28)
+    bold_large = get_font(NUNITO_BOLD, 26)
+    bold = get_font(NUNITO_BOLD, 24)
+    regular = get_font(NUNITO_REGULAR, 18)
+
+    load_snow_bank()
+
+    image = get_image(PROFILE_BACKGROUND)
+    draw = ImageDraw.Draw(image)
+    width, height = image.size
+
+    if center:
+        has_display_name = member["name"] != member["display_name"]
+        text_padding = 12
+        # Move everything up to make room for the recent activity
+        shift = 20 if codes else 0
+
+        # Display name
+        display_name, _ = get_max_str(bold_largest, member["display_name"], width - (text_padding * 2))
+        draw.text(
+            (width / 2, (70 if has_display_name else 80) - shift),
+            display_name,
+            font=bold_largest,
+            fill=(20, 20, 20),
+            anchor="ma",
+        )
+
+        # Username, if different from display name
+        if has_display_name:
+            username_str, _ = get_max_str(regular, f"@{member['name']}", width - (text_padding * 2))
+            draw.text((width / 2, 120 - shift), username_str, font=regular, fill=(50, 50, 50), anchor="ma")
+
+        # Points & rank
+        draw.text(
+            (width / 2, (170 if has_display_name else 150) - shift),
+            f"{user['points'] or 'No'} points{' yet' if not user['points'] else ''} · #{user['rank']}"
+            if user
+            else "On the @mod team",
+            font=bold,
+            fill=(20, 20, 20),
+            anchor="ma",
+        )
+
+        # Recent activity
+        for i, title in enumerate(codes):
+            title_str, _ = get_max_str(regular, f"• {title}", width - (text_padding * 2))
             draw.text(
-                (width - 20, 110),
-                f"#{user['rank']}" if user else "N/A",
-                font=BOLD,
+                (width / 2, (203 if has_display_name else 183) - shift + i * 22),
+                title_str,
+                font=regular,
                 fill=(50, 50, 50),
-                anchor="rs",
+                anchor="ma",
             )
 
-            # Points
-            points_str = f"{user['points'] or 'No'} points" if user else "On the @mod team"
-            points_str_len = REGULAR.getlength(points_str)
-            draw.text(
-                (width - 20, 140),
-                points_str,
-                font=REGULAR,
-                fill=(20, 20, 20),
-                anchor="ra",
-            )
+    else:
+        # Display name
+        display_name, _ = get_max_str(bold_large, member["display_name"], width - 20 - 70)
+        draw.text((20, 110), display_name, font=bold_large, fill=(20, 20, 20), anchor="ls")
+        # Rank
+        draw.text(
+            (width - 20, 110),
+            f"#{user['rank']}" if user else "N/A",
+            font=bold,
+            fill=(50, 50, 50),
+            anchor="rs",
+        )
 
-            # Username
-            username_str, _ = get_max_str(REGULAR, f"@{member.name}", width - 20 * 2 - points_str_len - 4)
-            draw.text((20, 140), username_str, font=REGULAR, fill=(50, 50, 50))
+        # Points
+        points_str = f"{user['points'] or 'No'} points" if user else "On the @mod team"
+        points_str_len = regular.getlength(points_str)
+        draw.text(
+            (width - 20, 140),
+            points_str,
+            font=regular,
+            fill=(20, 20, 20),
+            anchor="ra",
+        )
 
-        del draw
+        # Username
+        username_str, _ = get_max_str(regular, f"@{member['name']}", width - 20 * 2 - points_str_len - 4)
+        draw.text((20, 140), username_str, font=regular, fill=(50, 50, 50))
+
+        # Recent activity
+        for i, title in enumerate(codes):
+            title_str, _ = get_max_str(regular, f"• {title}", width - 20 * 2)
+            draw.text((20, 175 + i * 22), title_str, font=regular, fill=(50, 50, 50))
+
+    del draw
+
+    if animated:
+        # Only the text layer is per-request: snow is pre-rendered, and frames share one palette
+        frames = [
+            Image.alpha_composite(image, overlay).convert("RGB").quantize(palette=_gif_palette, dither=0)
+            for overlay in choice(_snow_bank)
+        ]
+
+        frames[0].save(
+            buffer,
+            format="GIF",
+            save_all=True,
+            append_images=frames[1:],
+            optimize=False,
+            duration=300,
+            loop=0,
+        )
+    else:
+        image.save(buffer, format="PNG")
 
-        if animated:
-            points = []
-            scatter_amount = 20
-            min_radius = 6
-            max_radius = 10
-
-            # Create initial points for snow
-            for i in range(0, width, int(width / 4)):
-                for j in range(0, height, int(height / 4)):
-                    points.append(
-                        (
-                            i + randint(-1 * scatter_amount, scatter_amount),
-                            j + randint(-1 * scatter_amount * 2, scatter_amount * 2),
-                            randint(min_radius, max_radius),
-                            randint(80, 130),
-                        )
-                    )
-
-            frames = []
-
-            # Create snow animation frames
-            for i in range(10):
-                overlay = Image.new("RGBA", image.size, (0, 0, 0, 0))
-                draw = ImageDraw.Draw(overlay)
-
-                # Draw points for snow
-                for x, y, radius, opacity in points:
-                    offset_x = randint(-10, 10)
-                    offset_y = i * 13
-                    offset_y = randint(offset_y - 5, offset_y + 5)
-
-                    draw.ellipse(
-                        (
-                            ((x + offset_x) % width - radius, (y + offset_y) % height - radius),
-                            ((x + offset_x) % width + radius, (y + offset_y) % height + radius),
-                        ),
-                        fill=(255, 255, 255, opacity),
-                    )
-
-                del draw
-
-                frames.append(Image.alpha_composite(image, overlay))
-
-            frames[0].save(
-                outfile,
-                save_all=True,
-                append_images=frames[1:],
-                optimize=False,
-                duration=300,
-                loop=0,
-            )
-        else:
-            image.save(outfile)
+    if outdir:
+        Path(f"{outdir}/profile_{member['name']}.{'gif' if animated else 'png'}").write_bytes(
+            buffer.getvalue()
+        )
 
-        return outfile
+    return buffer.getvalue()
 
 
 def setup(bot: HolidayBot) -> None:
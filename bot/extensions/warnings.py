@@ -5,6 +5,7 @@ from discord.ext import commands
 from discord.ext.commands import Cog, Context
 
 from bot.bot import HolidayBot
+from bot.rendering import RenderQueueFull, RenderTimeout
 
 
 class Warnings(Cog):
@@ -42,6 +43,12 @@ class Warnings(Cog):
         elif isinstance(e, commands.CommandNotFound):
             msg = f"Command not found! Use `{ctx.prefix}help` to list all available commands."
 
+        elif isinstance(e, RenderQueueFull):
+            msg = "I'm busy drawing images for other hackers. Try again in a few seconds!"
+
+        elif isinstance(e, RenderTimeout):
+            msg = "Drawing that image took too long. Try again in a few seconds!"
+
         else:
             msg = "Oh no! We hit an error."
 
@@ -0,0 +1,99 @@
+import asyncio
+from bisect import bisect_left, bisect_right, insort
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Sort key for a hacker: ascending order of (-points, -user_id) is the leaderboard order
+Key = Tuple[int, int]
+
+
+class Leaderboard:
+    """In-memory rank index of hackers, ordered by (points DESC, user_id DESC)."""
+
+    def __init__(self) -> None:
+        self._keys: List[Key] = []
+        self._points: Dict[int, int] = {}
+        self._loaded = asyncio.Event()
+
+        # Bumped on every change, so derived data (e.g. rendered pages) can be keyed on it
+        self.version = 0
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, user_id: int) -> bool:
+        return user_id in self._points
+
+    @staticmethod
+    def _key(user_id: int, points: int) -> Key:
+        return -points, -user_id
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the index has been loaded yet."""
+        return self._loaded.is_set()
+
+    def load(self, users: Iterable[Tuple[int, int]]) -> None:
+        """Replace the index with (user_id, points) pairs, e.g. fetched from the Users table."""
+        points = {user_id: points or 0 for user_id, points in users}
+
+        # A resync that finds nothing new keeps the version, and so whatever was derived from it
+        if self.loaded and points == self._points:
+            return
+
+        self._points = points
+        self._keys = sorted(self._key(user_id, points) for user_id, points in self._points.items())
+        self.version += 1
+        self._loaded.set()
+
+    async def wait_until_loaded(self) -> None:
+        """Wait until the index has been loaded from the database."""
+        await self._loaded.wait()
+
+    def update(self, user_id: int, points: int) -> None:
+        """Insert a hacker or move them to their new position."""
+        self.remove(user_id)
+
+        points = points or 0
+        self._points[user_id] = points
+        insort(self._keys, self._key(user_id, points))
+        self.version += 1
+
+    def remove(self, user_id: int) -> None:
+        """Remove a hacker from the index, if present."""
+        points = self._points.pop(user_id, None)
+
+        if points is not None:
+            del self._keys[bisect_left(self._keys, self._key(user_id, points))]
+            self.version += 1
+
+    def get_points(self, user_id: int) -> Optional[int]:
+        """Get the points of a hacker, or None if they are not registered."""
+        return self._points.get(user_id)
+
+    def get_rank(self, user_id: int) -> Optional[int]:
+        """Get the 1-based rank of a hacker in O(log n), or None if they are not registered."""
+        points = self._points.get(user_id)
+
+        if points is None:
+            return None
+
+        return bisect_left(self._keys, self._key(user_id, points)) + 1
+
+    def seek(self, points: int, user_id: int, after: bool = True) -> int:
+        """
+        Get the 0-based offset just after (or at) a (points, user_id) position, in O(log n).
+
+        The hacker doesn't have to be on the leaderboard anymore, so this is a stable keyset cursor.
+        """
+        key = self._key(user_id, points)
+
+        return bisect_right(self._keys, key) if after else bisect_left(self._keys, key)
+
+    def get_page(self, offset: int, limit: int = 10) -> List[Tuple[int, int, int]]:
+        """Get up to `limit` (rank, user_id, points) tuples starting at a 0-based offset."""
+        offset = max(offset, 0)
+
+        return [
+            (offset + i + 1, -neg_user_id, -neg_points)
+            for i, (neg_points, neg_user_id) in enumerate(self._keys[offset : offset + limit])
+        ]
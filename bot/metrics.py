@@ -0,0 +1,194 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from time import perf_counter
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+from aiohttp import web
+
+# Latency buckets in seconds, from a cached command to a slow render
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Size buckets in bytes, for rendered images
+SIZE_BUCKETS = tuple(1 << power for power in range(12, 24))
+
+Labels = Tuple[str, ...]
+
+
+class Metric:
+    """A named metric with a fixed set of label names, exposed in the Prometheus text format."""
+
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+
+    def _key(self, labels: Dict[str, str]) -> Labels:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def _format_labels(self, key: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labels, key)) + ([extra] if extra else [])
+
+        if not pairs:
+            return ""
+
+        escaped = (
+            (name, value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+            for name, value in pairs
+        )
+
+        return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+    def samples(self) -> Iterator[str]:
+        """Get the sample lines of the metric."""
+        raise NotImplementedError
+
+    def expose(self) -> str:
+        """Format the metric in the Prometheus text format."""
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.type}\n"
+
+        return header + "".join(f"{line}\n" for line in self.samples())
+
+
+class Counter(Metric):
+    """A value that only goes up, e.g. a number of requests."""
+
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labels)
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        """Increase the counter."""
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0.0) + amount
+
+    def samples(self) -> Iterator[str]:
+        """Get the sample lines of the metric."""
+        for key, value in self.values.items():
+            yield f"{self.name}{self._format_labels(key)} {value}"
+
+
+class Gauge(Counter):
+    """A value that goes up and down, e.g. a queue length."""
+
+    type = "gauge"
+
+    def set(self, value: float, **labels: str) -> None:
+        """Set the gauge."""
+        self.values[self._key(labels)] = value
+
+
+class Histogram(Metric):
+    """Counts observations (e.g. durations) in cumulative buckets, with their sum."""
+
+    type = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labels: Sequence[str] = (),
+        buckets: Sequence[float] = TIME_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # Per label set: per-bucket (non-cumulative) counts, with +Inf last, and the sum
+        self.counts: Dict[Labels, List[int]] = {}
+        self.sums: Dict[Labels, float] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        """Record an observation."""
+        key = self._key(labels)
+        counts = self.counts.setdefault(key, [0] * (len(self.buckets) + 1))
+        counts[bisect_left(self.buckets, value)] += 1
+        self.sums[key] = self.sums.get(key, 0.0) + value
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the duration of a block of code, in seconds."""
+        started = perf_counter()
+
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - started, **labels)
+
+    def samples(self) -> Iterator[str]:
+        """Get the sample lines of the metric."""
+        for key, counts in self.counts.items():
+            total = 0
+
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                total += count
+                yield f"{self.name}_bucket{self._format_labels(key, ('le', str(bound)))} {total}"
+
+            yield f"{self.name}_sum{self._format_labels(key)} {self.sums[key]}"
+            yield f"{self.name}_count{self._format_labels(key)} {total}"
+
+
+M = TypeVar("M", bound=Metric)
+
+
+class Registry:
+    """The metrics of the bot, as served on the metrics endpoint."""
+
+    def __init__(self) -> None:
+        self.metrics: List[Metric] = []
+
+    def register(self, metric: M) -> M:
+        """Add a metric to the registry."""
+        self.metrics.append(metric)
+        return metric
+
+    def expose(self) -> str:
+        """Format every metric in the Prometheus text format."""
+        return "".join(metric.expose() for metric in self.metrics)
+
+
+REGISTRY = Registry()
+
+COMMAND_SECONDS = REGISTRY.register(
+    Histogram(
+        "holiday_command_seconds", "Command latency, after checks and conversion.", ("command", "outcome")
+    )
+)
+QUERY_SECONDS = REGISTRY.register(
+    Histogram("holiday_query_seconds", "Database query latency, per statement.", ("statement",))
+)
+POOL_ACQUIRE_SECONDS = REGISTRY.register(
+    Histogram("holiday_pool_acquire_seconds", "Time spent waiting for a database connection.")
+)
+RENDER_SECONDS = REGISTRY.register(
+    Histogram("holiday_render_seconds", "Image render latency, including queueing.", ("renderer",))
+)
+RENDER_BYTES = REGISTRY.register(
+    Histogram("holiday_render_bytes", "Rendered image size.", ("renderer",), buckets=SIZE_BUCKETS)
+)
+RENDER_REJECTED = REGISTRY.register(
+    Counter("holiday_render_rejected_total", "Render jobs rejected or timed out.", ("renderer", "reason"))
+)
+RENDER_PENDING = REGISTRY.register(Gauge("holiday_render_pending", "Render jobs queued or running."))
+SCHEDULE_FETCH_SECONDS = REGISTRY.register(
+    Histogram("holiday_schedule_fetch_seconds", "Schedule fetch latency.", ("result",))
+)
+CACHE_LOOKUPS = REGISTRY.register(
+    Counter("holiday_cache_lookups_total", "Cache lookups.", ("cache", "result"))
+)
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """Serve the metrics at http://<host>:<port>/metrics."""
+
+    async def handle(request: web.Request) -> web.Response:
+        return web.Response(text=REGISTRY.expose(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+
+    return runner
@@ -0,0 +1,43 @@
+from pathlib import Path
+
+from asyncpg import Connection
+from loguru import logger
+
+MIGRATIONS_DIR = Path("postgres/migrations")
+
+# Arbitrary key for the advisory lock held while migrating, in case two bots start at once
+MIGRATIONS_LOCK = 2020_12_01
+
+
+async def run_migrations(conn: Connection) -> None:
+    """
+    Apply pending schema migrations.
+
+    Migrations are the `<version>_<name>.sql` files in postgres/migrations, applied in version order.
+    init.sql only runs when the database is first created, so this is how existing deployments
+    get schema changes.
+    """
+    async with conn.transaction():
+        await conn.execute("SELECT pg_advisory_xact_lock($1)", MIGRATIONS_LOCK)
+        await conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS SchemaMigrations(
+                version INT PRIMARY KEY,
+                name TEXT,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            )
+            """
+        )
+
+        applied = {record["version"] for record in await conn.fetch("SELECT version FROM SchemaMigrations")}
+        migrations = sorted((int(path.name.split("_")[0]), path) for path in MIGRATIONS_DIR.glob("*.sql"))
+
+        for version, path in migrations:
+            if version in applied:
+                continue
+
+            await conn.execute(path.read_text())
+            await conn.execute(
+                "INSERT INTO SchemaMigrations (version, name) VALUES ($1, $2)", version, path.stem
+            )
+            logger.info(f'Applied migration "{path.name}"')
@@ -0,0 +1,151 @@
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from asyncpg import Connection
+
+from bot.codes import ActivityCode
+from bot.database import MeteredPool, trace
+
+# Every statement the bot runs, by name. The text always matches, so each connection's statement cache
+# prepares a statement on its first use and reuses it after that.
+STATEMENTS = {
+    # Records & credits a redemption atomically in one round trip.
+    # The (user_id, code) primary key makes concurrent duplicate redemptions a no-op.
+    "redeem": """
+        WITH redemption AS (
+            INSERT INTO Redemptions (user_id, code)
+            SELECT user_id, $2 FROM Users WHERE user_id = $1
+            ON CONFLICT DO NOTHING
+            RETURNING user_id
+        ), credited AS (
+            UPDATE Users
+            SET points = points + $3
+            WHERE user_id = (SELECT user_id FROM redemption)
+            RETURNING points
+        )
+        SELECT
+            EXISTS (SELECT 1 FROM Users WHERE user_id = $1) AS registered,
+            (SELECT points FROM credited) AS points
+    """,
+    # One set-based UPDATE for a whole team; users it doesn't return are not registered
+    "give_points": """
+        UPDATE Users
+        SET points = points + $2
+        WHERE user_id = ANY($1::BIGINT[])
+        RETURNING user_id, points
+    """,
+    "register_user": """
+        INSERT INTO Users (user_id, points) VALUES ($1, 0)
+        ON CONFLICT DO NOTHING
+        RETURNING user_id
+    """,
+    "unregister_user": "DELETE FROM Users WHERE user_id = $1",
+    "reset_users": "DELETE FROM Users",
+    # Read in leaderboard order, straight off the users_leaderboard_idx index
+    "leaderboard": "SELECT user_id, points FROM Users ORDER BY points DESC, user_id DESC",
+    # Most recent activities, from the (user_id, redeemed_at) index
+    "recent_activities": """
+        SELECT Codes.title
+        FROM Redemptions
+        JOIN Codes USING (code)
+        WHERE user_id = $1
+        ORDER BY redeemed_at DESC
+        LIMIT $2
+    """,
+    "codes": "SELECT code, title, points FROM Codes",
+    "upsert_code": """
+        INSERT INTO Codes (code, title, points) VALUES ($1, $2, $3)
+        ON CONFLICT (code) DO UPDATE SET title = EXCLUDED.title, points = EXCLUDED.points
+    """,
+    "delete_codes": "DELETE FROM Codes WHERE code = ANY($1::TEXT[])",
+}
+
+
+class Queries:
+    """The bot's database operations. Statements are looked up by name, so their text always matches."""
+
+    def __init__(self) -> None:
+        self.pool: Optional[MeteredPool] = None
+        self._connected = asyncio.Event()
+
+    def connect(self, pool: MeteredPool) -> None:
+        """Start running queries on a pool."""
+        self.pool = pool
+        self._connected.set()
+
+    async def wait_until_connected(self) -> None:
+        """Wait until the pool is connected."""
+        await self._connected.wait()
+
+    @asynccontextmanager
+    async def _acquire(self) -> AsyncIterator[Connection]:
+        # Queries made while the bot is still connecting to the database wait for the pool
+        await self._connected.wait()
+
+        async with self.pool.acquire() as conn:
+            yield conn
+
+    async def _run(self, method: str, name: str, *args: Any) -> Any:
+        async with self._acquire() as conn:
+            with trace(name, STATEMENTS[name], args):
+                return await getattr(conn, method)(STATEMENTS[name], *args)
+
+    async def redeem(self, user_id: int, code: ActivityCode) -> Tuple[bool, Optional[int]]:
+        """Redeem a code, returning whether the user is registered and their new points, if credited."""
+        result = await self._run("fetchrow", "redeem", user_id, code.code, code.points)
+
+        return result["registered"], result["points"]
+
+    async def give_points(self, user_ids: List[int], points: int) -> Dict[int, int]:
+        """Give points to users, returning the new points of those who are registered."""
+        updated = await self._run("fetch", "give_points", user_ids, points)
+
+        return {record["user_id"]: record["points"] for record in updated}
+
+    async def register_user(self, user_id: int) -> bool:
+        """Register a user with 0 points, returning whether they weren't registered yet."""
+        return await self._run("fetchval", "register_user", user_id) is not None
+
+    async def unregister_user(self, user_id: int) -> None:
+        """Unregister a user, with their redemptions."""
+        await self._run("execute", "unregister_user", user_id)
+
+    async def reset_users(self, users: List[Tuple[int, int]]) -> None:
+        """Replace every registered user with (user_id, points) pairs."""
+        async with self._acquire() as conn:
+            async with conn.transaction():
+                with trace("reset_users", STATEMENTS["reset_users"], ()):
+                    await conn.execute(STATEMENTS["reset_users"])
+
+                # Bulk load the rows with COPY instead of one INSERT per hacker
+                with trace("copy_users", "COPY users", (users,)):
+                    await conn.copy_records_to_table("users", records=users, columns=("user_id", "points"))
+
+    async def get_leaderboard(self) -> List[Tuple[int, int]]:
+        """Get every (user_id, points) pair, in leaderboard order."""
+        users = await self._run("fetch", "leaderboard")
+
+        return [(user["user_id"], user["points"]) for user in users]
+
+    async def get_recent_activities(self, user_id: int, count: int) -> List[str]:
+        """Get the titles of the codes a user redeemed most recently."""
+        codes = await self._run("fetch", "recent_activities", user_id, count)
+
+        return [code["title"] for code in codes]
+
+    async def get_codes(self) -> List[ActivityCode]:
+        """Get every activity code."""
+        return [ActivityCode(*code) for code in await self._run("fetch", "codes")]
+
+    async def sync_codes(self, upserts: List[ActivityCode], deletes: List[str]) -> None:
+        """Add or change some activity codes and delete others, atomically."""
+        async with self._acquire() as conn:
+            async with conn.transaction():
+                rows = [(code.code, code.title, code.points) for code in upserts]
+
+                with trace("upsert_code", STATEMENTS["upsert_code"], (rows,)):
+                    await conn.executemany(STATEMENTS["upsert_code"], rows)
+
+                with trace("delete_codes", STATEMENTS["delete_codes"], (deletes,)):
+                    await conn.execute(STATEMENTS["delete_codes"], deletes)
@@ -0,0 +1,147 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from os import cpu_count, getpid
+from time import perf_counter
+from typing import Any, Callable, Dict, Optional, Sequence, TypeVar
+
+from loguru import logger
+
+from bot.metrics import RENDER_BYTES, RENDER_PENDING, RENDER_REJECTED, RENDER_SECONDS
+
+T = TypeVar("T")
+
+# The most workers started by default: renders are short, and each worker holds its own fonts & assets
+DEFAULT_MAX_WORKERS = 4
+
+
+def run_warm_ups(warm_ups: Sequence[Callable[[], Any]]) -> None:
+    """Run the warm-ups in a new worker process, before its first job."""
+    for warm_up in warm_ups:
+        # An initializer that raises breaks the whole pool; without the warm-up, renders are just slower
+        try:
+            warm_up()
+        except Exception:
+            logger.exception(f"Render worker warm-up {warm_up.__qualname__} failed")
+
+
+class RenderQueueFull(Exception):
+    """Raised when the render queue has no free slots left."""
+
+
+class RenderTimeout(Exception):
+    """Raised when a render job takes longer than the configured timeout."""
+
+
+class RenderExecutor:
+    """
+    Runs PIL renderers in a bounded process pool, so they never block the event loop.
+
+    Jobs must be module-level functions taking picklable arguments.
+    """
+
+    def __init__(self, workers: Optional[int] = None, queue_size: int = 32, timeout: float = 10.0) -> None:
+        self.workers = workers or min(cpu_count() or 1, DEFAULT_MAX_WORKERS)
+        self.timeout = timeout
+        self.queue_size = queue_size
+        # Run in every worker as it starts, e.g. to load fonts & pre-render assets, by qualified name
+        self.warm_ups: Dict[str, Callable[[], Any]] = {}
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Number of jobs queued or running."""
+        return self._pending
+
+    @property
+    def executor(self) -> ProcessPoolExecutor:
+        """The worker pool, created on first use with the warm-ups added so far."""
+        if self._executor is None:
+            # Forking the bot would copy its threads' state & its open sockets (Discord, Postgres) into
+            # every worker, so workers start from a fresh process instead
+            start_method = (
+                "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+            )
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context(start_method),
+                initializer=run_warm_ups,
+                initargs=(tuple(self.warm_ups.values()),),
+            )
+
+        return self._executor
+
+    def add_warm_up(self, fn: Callable[[], Any]) -> None:
+        """Add a module-level function for every worker to run as it starts. Re-adding one replaces it."""
+        self.warm_ups[f"{fn.__module__}.{fn.__qualname__}"] = fn
+
+    async def start(self) -> None:
+        """Start & warm up every worker now, instead of on the first renders."""
+        loop = asyncio.get_event_loop()
+
+        # One job per worker, as workers may only be started when jobs come in while the others are busy
+        await asyncio.gather(*(loop.run_in_executor(self.executor, getpid) for _ in range(self.workers)))
+
+    async def submit(self, fn: Callable[..., T], *args: Any) -> T:
+        """Run a render job in the pool, rejecting it if the queue is full."""
+        renderer = fn.__name__
+
+        if self._pending >= self.queue_size:
+            RENDER_REJECTED.inc(renderer=renderer, reason="queue_full")
+            raise RenderQueueFull
+
+        started = perf_counter()
+
+        try:
+            executor = self.executor
+
+            try:
+                result = await self._run(executor, fn, args, self.timeout)
+            except BrokenProcessPool:
+                # A worker died (e.g. killed for using too much memory), which breaks the whole pool
+                logger.warning(f"A render worker died, restarting the render workers to retry {renderer}.")
+                self._replace(executor)
+                result = await self._run(self.executor, fn, args, self.timeout - (perf_counter() - started))
+        except asyncio.TimeoutError:
+            RENDER_REJECTED.inc(renderer=renderer, reason="timeout")
+            raise RenderTimeout from None
+
+        RENDER_SECONDS.observe(perf_counter() - started, renderer=renderer)
+
+        if isinstance(result, bytes):
+            RENDER_BYTES.observe(len(result), renderer=renderer)
+
+        return result
+
+    async def _run(
+        self, executor: ProcessPoolExecutor, fn: Callable[..., T], args: tuple, timeout: float
+    ) -> T:
+        future = asyncio.get_event_loop().run_in_executor(executor, fn, *args)
+
+        # A job that timed out keeps its worker busy, so its slot is only freed once it really finishes
+        self._pending += 1
+        RENDER_PENDING.set(self._pending)
+        future.add_done_callback(self._finish)
+
+        return await asyncio.wait_for(asyncio.shield(future), timeout)
+
+    def _finish(self, future: asyncio.Future) -> None:
+        self._pending -= 1
+        RENDER_PENDING.set(self._pending)
+
+        # Nobody awaits a job that timed out
+        if not future.cancelled():
+            future.exception()
+
+    def _replace(self, executor: ProcessPoolExecutor) -> None:
+        # Concurrent jobs of the broken pool all fail at once, and only the first one replaces it
+        if self._executor is executor:
+            executor.shutdown(wait=False)
+            self._executor = None
+
+    def shutdown(self) -> None:
+        """Stop the worker processes without waiting for queued jobs."""
+        if self._executor:
+            self._executor.shutdown(wait=False)
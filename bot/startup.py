@@ -0,0 +1,130 @@
+import sys
+from contextlib import contextmanager
+from dataclasses import dataclass
+from functools import wraps
+from importlib.abc import Loader, MetaPathFinder
+from importlib.machinery import ModuleSpec, PathFinder
+from time import perf_counter
+from types import ModuleType
+from typing import Any, Iterable, Iterator, List, Optional, Sequence
+
+from loguru import logger
+
+
+@dataclass
+class StartupStep:
+    """A dataclass for one timed step of starting the bot."""
+
+    name: str
+    # How long the step took, and when it finished (since startup began), in seconds
+    seconds: float
+    finished_at: float
+
+
+class TimedExtensionLoader(Loader):
+    """Wraps an extension's loader to time running the module and its `setup` function apart."""
+
+    def __init__(self, loader: Loader, profiler: "StartupProfiler") -> None:
+        self.loader = loader
+        self.profiler = profiler
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.loader, name)
+
+    def create_module(self, spec: ModuleSpec) -> Optional[ModuleType]:
+        """Create the module like the wrapped loader does."""
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module: ModuleType) -> None:
+        """Run the module (with what it imports), timed, then wrap its `setup` to time it too."""
+        name = module.__name__
+
+        with self.profiler.time(f"import {name}"):
+            self.loader.exec_module(module)
+
+        setup = getattr(module, "setup", None)
+
+        if setup is None:
+            return
+
+        @wraps(setup)
+        def timed_setup(*args: Any) -> None:
+            with self.profiler.time(f"set up {name}"):
+                setup(*args)
+
+        module.setup = timed_setup
+
+
+class TimedExtensionFinder(MetaPathFinder):
+    """Finds extension modules like the regular path finder, with their loaders wrapped for timing."""
+
+    def __init__(self, names: Iterable[str], profiler: "StartupProfiler") -> None:
+        self.names = set(names)
+        self.profiler = profiler
+
+    def find_spec(
+        self, fullname: str, path: Optional[Sequence[str]], target: Optional[ModuleType] = None
+    ) -> Optional[ModuleSpec]:
+        """Find one of the extensions, or leave the module to the other finders."""
+        if fullname not in self.names:
+            return None
+
+        spec = PathFinder.find_spec(fullname, path, target)
+
+        if spec and spec.loader:
+            spec.loader = TimedExtensionLoader(spec.loader, self.profiler)
+
+        return spec
+
+
+class StartupProfiler:
+    """Times the steps of starting the bot (imports, cog setup, initial loads), for the startup report."""
+
+    def __init__(self) -> None:
+        self.started = perf_counter()
+        self.steps: List[StartupStep] = []
+        self.ready_at: Optional[float] = None
+
+    def record(self, name: str, seconds: float) -> None:
+        """Record a step that just finished."""
+        finished_at = perf_counter() - self.started
+        self.steps.append(StartupStep(name, seconds, finished_at))
+
+        logger.info(f"Startup: {name} took {seconds * 1000:.0f}ms, done at +{finished_at:.2f}s")
+
+    @contextmanager
+    def time(self, name: str) -> Iterator[None]:
+        """Time a block of code as a startup step."""
+        started = perf_counter()
+
+        try:
+            yield
+        finally:
+            self.record(name, perf_counter() - started)
+
+    @contextmanager
+    def timing_extensions(self, names: Iterable[str]) -> Iterator[None]:
+        """Time the import & the setup of extensions apart, as they are loaded in this block."""
+        finder = TimedExtensionFinder(names, self)
+        sys.meta_path.insert(0, finder)
+
+        try:
+            yield
+        finally:
+            sys.meta_path.remove(finder)
+
+    def ready(self) -> None:
+        """Note that the bot is ready for the first time, and log the steps so far, slowest first."""
+        if self.ready_at is not None:
+            return
+
+        self.ready_at = perf_counter() - self.started
+        steps = sorted(self.steps, key=lambda step: step.seconds, reverse=True)
+
+        logger.info(
+            f"Startup: first ready at +{self.ready_at:.2f}s\n"
+            + "\n".join(
+                f"{step.seconds * 1000:>8.0f}ms  done at +{step.finished_at:.2f}s  {step.name}"
+                for step in steps
+            )
+        )
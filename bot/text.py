@@ -0,0 +1,56 @@
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import accumulate
+from typing import Dict, List, Tuple
+
+from PIL import ImageFont
+
+ELLIPSIS = "..."
+
+# Glyph advances, per font, per character
+_advances: Dict[ImageFont.FreeTypeFont, Dict[str, float]] = {}
+
+
+def get_advance(font: ImageFont.FreeTypeFont, char: str) -> float:
+    """Get the (cached) advance width of a single character."""
+    advances = _advances.setdefault(font, {})
+    advance = advances.get(char)
+
+    if advance is None:
+        advance = advances[char] = font.getlength(char)
+
+    return advance
+
+
+def get_prefix_widths(font: ImageFont.FreeTypeFont, text: str) -> List[float]:
+    """Get the summed glyph advances of every prefix of `text`, starting with the empty one."""
+    return [0.0, *accumulate(get_advance(font, char) for char in text)]
+
+
+@lru_cache(maxsize=4096)
+def get_max_str(font: ImageFont.FreeTypeFont, text: str, max_size: float) -> Tuple[str, float]:
+    """Get the longest string that fits a width, truncated with an ellipsis, and its width."""
+    # Fit & cut are decided on the summed (cached) glyph advances; only candidate strings are laid out
+    widths = get_prefix_widths(font, text)
+
+    if widths[-1] <= max_size:
+        length = font.getlength(text)
+
+        # Kerning can make the real width a little wider than the estimate
+        if length <= max_size:
+            return text, length
+
+    ellipsis_width = sum(get_advance(font, char) for char in ELLIPSIS)
+    cut = bisect_right(widths, max_size - ellipsis_width) - 1
+
+    # ...then correct the cut with the real (kerned) width of the truncated string
+    while cut > 0:
+        truncated = text[:cut].rstrip() + ELLIPSIS
+        length = font.getlength(truncated)
+
+        if length <= max_size:
+            return truncated, length
+
+        cut -= 1
+
+    return "", 0
@@ -1,24 +1,89 @@
-from typing import Tuple
+import asyncio
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Optional, TypeVar
 
-from PIL import ImageFont
+from bot.metrics import CACHE_LOOKUPS
 
+T = TypeVar("T")
 
-# TODO: move to utility cog for reloading?
-def get_max_str(font: ImageFont, text: str, max_size: int) -> Tuple[str, float]:
-    """Get max string that fits a width."""
-    cur_text = ""
-    cur_len = 0
 
-    for char in text:
-        length = font.getlength(char)
+class SingleFlight:
+    """Coalesces concurrent calls with the same key into one in-flight call whose result is shared."""
 
-        if cur_len + length <= max_size:
-            cur_text += char
-            cur_len += length
-        else:
-            break
+    def __init__(self) -> None:
+        self._calls: Dict[Hashable, asyncio.Future] = {}
 
-    if len(text) > len(cur_text) and len(cur_text):
-        cur_text = cur_text[:-2] + "..."
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """Await `fn()`, or the call already in flight for `key`."""
+        future = self._calls.get(key)
 
-    return cur_text, cur_len
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._forget(key, done))
+
+        # Shielded, so one cancelled waiter doesn't cancel the call for everyone else
+        return await asyncio.shield(future)
+
+    def _forget(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._calls.get(key) is future:
+            del self._calls[key]
+
+
+class BytesLRUCache:
+    """LRU cache of encoded images (or any bytes), capped by their total size."""
+
+    def __init__(self, max_bytes: int, name: str = "bytes") -> None:
+        self.max_bytes = max_bytes
+        self.name = name
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._items: "OrderedDict[Hashable, bytes]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        """Get a cached value, marking it as recently used."""
+        value = self._items.get(key)
+
+        if value is None:
+            self.misses += 1
+            CACHE_LOOKUPS.inc(cache=self.name, result="miss")
+            return None
+
+        self.hits += 1
+        CACHE_LOOKUPS.inc(cache=self.name, result="hit")
+        self._items.move_to_end(key)
+
+        return value
+
+    def put(self, key: Hashable, value: bytes) -> None:
+        """Cache a value, evicting the least recently used ones until it fits."""
+        if len(value) > self.max_bytes:
+            return
+
+        self.size -= len(self._items.pop(key, b""))
+
+        while self._items and self.size + len(value) > self.max_bytes:
+            _, evicted = self._items.popitem(last=False)
+            self.size -= len(evicted)
+
+        self._items[key] = value
+        self.size += len(value)
+
+    def clear(self) -> None:
+        """Drop all cached values."""
+        self._items.clear()
+        self.size = 0
+
+    def stats(self) -> str:
+        """Summarize the cache usage and hit rate."""
+        lookups = self.hits + self.misses
+        hit_rate = self.hits / lookups if lookups else 0
+
+        return (
+            f"{len(self)} items, {self.size / 1024:.1f}/{self.max_bytes / 1024:.0f} KiB, "
+            f"{self.hits} hits, {self.misses} misses ({hit_rate:.0%} hit rate)"
+        )
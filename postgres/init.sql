@@ -2,12 +2,22 @@
 
 CREATE TABLE IF NOT EXISTS Users(
     user_id BIGINT PRIMARY KEY,
-    points INT,
-    special_codes TEXT[]
+    points INT
 );
 
+CREATE INDEX IF NOT EXISTS users_leaderboard_idx ON Users (points DESC, user_id DESC);
+
 CREATE TABLE IF NOT EXISTS Codes(
     code TEXT PRIMARY KEY,
     title TEXT,
     points INT
 );
+
+CREATE TABLE IF NOT EXISTS Redemptions(
+    user_id BIGINT REFERENCES Users(user_id) ON DELETE CASCADE,
+    code TEXT,
+    redeemed_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    PRIMARY KEY (user_id, code)
+);
+
+CREATE INDEX IF NOT EXISTS redemptions_recent_idx ON Redemptions (user_id, redeemed_at DESC);
@@ -0,0 +1,17 @@
+-- Track redemptions in their own table instead of Users.special_codes
+CREATE TABLE IF NOT EXISTS Redemptions(
+    user_id BIGINT REFERENCES Users(user_id) ON DELETE CASCADE,
+    code TEXT,
+    PRIMARY KEY (user_id, code)
+);
+
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1 FROM information_schema.columns WHERE table_name = 'users' AND column_name = 'special_codes'
+    ) THEN
+        INSERT INTO Redemptions (user_id, code)
+        SELECT user_id, unnest(special_codes) FROM Users
+        ON CONFLICT DO NOTHING;
+    END IF;
+END $$;
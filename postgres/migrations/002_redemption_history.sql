@@ -0,0 +1,7 @@
+-- Timestamp redemptions, index them for the profile card's recent activity,
+-- and drop the Users.special_codes array they replaced
+ALTER TABLE Redemptions ADD COLUMN IF NOT EXISTS redeemed_at TIMESTAMPTZ NOT NULL DEFAULT now();
+
+CREATE INDEX IF NOT EXISTS redemptions_recent_idx ON Redemptions (user_id, redeemed_at DESC);
+
+ALTER TABLE Users DROP COLUMN IF EXISTS special_codes;
@@ -0,0 +1,2 @@
+-- Covering index for reading the leaderboard in order, and for keyset seeks by (points, user_id)
+CREATE INDEX IF NOT EXISTS users_leaderboard_idx ON Users (points DESC, user_id DESC);